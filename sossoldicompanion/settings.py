@@ -28,7 +28,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv("DJANGO_SECRET_KEY", "default-secret-key")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = os.getenv("DJANGO_DEBUG", "False")
+DEBUG = os.getenv("DJANGO_DEBUG", "False").lower() in ("true", "1", "yes")
 
 ALLOWED_HOSTS = []
 
@@ -81,20 +81,23 @@ WSGI_APPLICATION = "sossoldicompanion.wsgi.application"
 
 if DEBUG:
     DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+            # SQLite ignores select_for_update(): transactions take the write lock
+            # when they start, so the web server and the workers run them in turn
+            "OPTIONS": {"transaction_mode": "IMMEDIATE"},
         }
     }
 else:
     DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.postgresql',
-            'NAME': os.getenv('DB_NAME', 'sossoldicompanion'),
-            'USER': os.getenv('DB_USER', 'myuser'),
-            'PASSWORD': os.getenv('DB_PASSWORD', 'mypassword'),
-            'HOST': os.getenv('DB_HOST', 'db'),
-            'PORT': os.getenv('DB_PORT', '5432'),
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("DB_NAME", "sossoldicompanion"),
+            "USER": os.getenv("DB_USER", "myuser"),
+            "PASSWORD": os.getenv("DB_PASSWORD", "mypassword"),
+            "HOST": os.getenv("DB_HOST", "db"),
+            "PORT": os.getenv("DB_PORT", "5432"),
         }
     }
 
@@ -135,6 +138,10 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Uploaded files (CSV files waiting to be imported)
+
+MEDIA_ROOT = os.getenv("DJANGO_MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -144,5 +151,124 @@ LOGIN_URL = "/login/"
 
 LOGIN_REDIRECT_URL = "home_accounts"
 
-OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://host.docker.internal:11434/api/generate")
-OLLAMA_ENABLE = os.getenv("OLLAMA_ENABLE", "False").lower() in ("true", "1", "yes")
\ No newline at end of file
+OLLAMA_API_URL = os.getenv(
+    "OLLAMA_API_URL", "http://host.docker.internal:11434/api/generate"
+)
+OLLAMA_ENABLE = os.getenv("OLLAMA_ENABLE", "False").lower() in ("true", "1", "yes")
+# Number of transactions classified by a single Ollama prompt
+OLLAMA_BATCH_SIZE = int(os.getenv("OLLAMA_BATCH_SIZE", "20"))
+# Seconds before an Ollama call is abandoned
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+# Ollama calls running at the same time during an import
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "4"))
+# Consecutive failed (or slower than OLLAMA_SLOW_CALL_SECONDS) calls after which
+# the rest of the import uses the fallback category
+OLLAMA_MAX_FAILURES = int(os.getenv("OLLAMA_MAX_FAILURES", "3"))
+OLLAMA_SLOW_CALL_SECONDS = float(os.getenv("OLLAMA_SLOW_CALL_SECONDS", "30"))
+# Local classifier answering before Ollama: it is used only once trained on
+# LOCAL_CLASSIFIER_MIN_DOCUMENTS transactions, and only for predictions whose
+# probability reaches LOCAL_CLASSIFIER_THRESHOLD
+LOCAL_CLASSIFIER_ENABLE = os.getenv("LOCAL_CLASSIFIER_ENABLE", "True").lower() in (
+    "true",
+    "1",
+    "yes",
+)
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+LOCAL_CLASSIFIER_MIN_DOCUMENTS = int(os.getenv("LOCAL_CLASSIFIER_MIN_DOCUMENTS", "50"))
+# Features (words and word pairs) a user's local classifier remembers at most,
+# bounding the size of the stored model
+LOCAL_CLASSIFIER_MAX_TOKENS = int(os.getenv("LOCAL_CLASSIFIER_MAX_TOKENS", "20000"))
+# Merchants whose predicted category is kept in the in-process LRU cache
+CATEGORY_CACHE_SIZE = int(os.getenv("CATEGORY_CACHE_SIZE", "10000"))
+
+# Number of CSV rows looked up and written per query during an import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Limits of the CSV files of a multi-file (ZIP) import, checked while the
+# archive is decompressed
+IMPORT_ARCHIVE_MAX_FILES = int(os.getenv("IMPORT_ARCHIVE_MAX_FILES", "100"))
+IMPORT_ARCHIVE_MAX_BYTES = int(
+    os.getenv("IMPORT_ARCHIVE_MAX_BYTES", str(200 * 1024 * 1024))
+)
+# Days between the two legs of an internal transfer for them to be linked
+TRANSFER_MATCH_DAYS = int(os.getenv("TRANSFER_MATCH_DAYS", "3"))
+# Seconds a previewed import can be confirmed without uploading the file again
+IMPORT_PREVIEW_TIMEOUT = int(os.getenv("IMPORT_PREVIEW_TIMEOUT", "3600"))
+# Seconds without a heartbeat after which a running import job is considered
+# orphaned by a crashed worker and queued again
+IMPORT_JOB_STALE_SECONDS = int(os.getenv("IMPORT_JOB_STALE_SECONDS", "600"))
+# Seconds between the heartbeats a worker sends for the job it is running,
+# however long its current batch takes
+IMPORT_JOB_HEARTBEAT_SECONDS = int(os.getenv("IMPORT_JOB_HEARTBEAT_SECONDS", "30"))
+
+# Number of transactions fetched per query while streaming an export
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+# Full exports up to this size are kept in the "exports" cache
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Transactions per page of the transactions listing and of its JSON API
+TRANSACTIONS_PAGE_SIZE = int(os.getenv("TRANSACTIONS_PAGE_SIZE", "50"))
+# Seconds the summary of a user's bank accounts, checked by every page that
+# requires one, is cached. Changes made by this process invalidate it at once;
+# the timeout bounds how long other processes may see the old one
+ACCOUNT_SUMMARY_TIMEOUT = int(os.getenv("ACCOUNT_SUMMARY_TIMEOUT", "300"))
+
+# Bearer token Prometheus must send to read /metrics and the worker's metrics
+# port; the metrics are not served when it is empty
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+# LOG_LEVEL=DEBUG also logs the prompts sent to Ollama; WARNING silences the
+# per-import and per-export summary lines
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {
+            "format": "{asctime} {levelname} {name} {message}",
+            "style": "{",
+        },
+    },
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+            "formatter": "plain",
+        },
+    },
+    "loggers": {
+        "transactionmanager": {
+            "handlers": ["console"],
+            "level": os.getenv("LOG_LEVEL", "INFO").upper(),
+            "propagate": False,
+        },
+    },
+}
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Rendered exports, evicted least recently used first
+    "exports": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "exports",
+        "TIMEOUT": None,
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("EXPORT_CACHE_MAX_ENTRIES", "50")),
+        },
+    },
+    # Parsed and classified rows of previewed imports, shared by the web
+    # process and the import workers through the media volume
+    "imports": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(MEDIA_ROOT, "import-previews"),
+        "TIMEOUT": IMPORT_PREVIEW_TIMEOUT,
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("IMPORT_PREVIEW_MAX_ENTRIES", "100")),
+        },
+    },
+}
@@ -1,8 +1,18 @@
 from django.contrib import admin
 
-from .models import BankAccount, Category, Transaction
+from .models import (
+    BankAccount,
+    Category,
+    ImportedFile,
+    ImportJob,
+    MonthlyRollup,
+    Transaction,
+)
 
 # Register your models here.
 admin.site.register(BankAccount)
 admin.site.register(Category)
 admin.site.register(Transaction)
+admin.site.register(ImportJob)
+admin.site.register(ImportedFile)
+admin.site.register(MonthlyRollup)
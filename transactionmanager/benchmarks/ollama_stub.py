@@ -0,0 +1,70 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NUMBERED_ROW_RE = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    """
+    Answer Ollama /api/generate requests with the first category of the prompt,
+    after sleeping for the server latency. Batch prompts asking for JSON get an
+    object with an answer for every numbered transaction.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = payload.get("prompt", "")
+        time.sleep(self.server.latency)
+        self.server.calls += 1
+
+        match = re.search(r"Categorie possibili: ([^,\n]+)", prompt)
+        category = match.group(1) if match else "Altro"
+        if payload.get("format") == "json":
+            answer = json.dumps(
+                {index: category for index in NUMBERED_ROW_RE.findall(prompt)}
+            )
+        else:
+            answer = category
+
+        body = json.dumps({"response": answer}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class OllamaStub:
+    """
+    Local stand-in for the Ollama API with a configurable latency per call.
+    Use as a context manager; `url` is the generate endpoint.
+    """
+
+    def __init__(self, latency=0.0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), OllamaStubHandler)
+        self.server.latency = latency
+        self.server.calls = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/api/generate"
+
+    @property
+    def calls(self):
+        return self.server.calls
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
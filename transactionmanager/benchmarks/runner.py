@@ -0,0 +1,175 @@
+import platform
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from ..models import BankAccount, Category, Transaction
+from ..services import prediction_cache
+from ..services.dispatcher import dispatch_import
+from ..services.export import Exporter
+from .ollama_stub import OllamaStub
+from .synthetic import MERCHANT_RATIO, write_n26_csv
+
+User = get_user_model()
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries run by the current thread.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(name, rows, func, trace_memory=True):
+    """
+    Run `func` once and return its wall time, query count and peak memory.
+    """
+    counter = QueryCounter()
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        func()
+    seconds = time.perf_counter() - start
+
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "name": name,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+        "queries": counter.count,
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def create_account(name):
+    user = User.objects.create(username=name, first_name="Mario", last_name="Rossi")
+    account = BankAccount.objects.create(
+        user=user, iban=f"DE{user.pk:020d}", name=name, bank_type="n26"
+    )
+    return user, account
+
+
+def import_file(user, account, path):
+    with open(path, "rb") as csv_file:
+        return dispatch_import(
+            user=user, file=File(csv_file), bank_format="n26", iban=account.iban
+        )
+
+
+def export_user(user):
+    return Exporter(
+        Transaction.objects.filter(
+            bank_account__user=user, linked_transfer__isnull=True
+        ),
+        user,
+        categories=Category.objects.filter(created_by=user).order_by("id"),
+        in_categories=Category.input_categories(user).values_list("name", flat=True),
+    ).render_transactions_to_csv()
+
+
+def run_benchmarks(
+    sizes,
+    ollama_latency=0.0,
+    with_ollama=True,
+    trace_memory=True,
+    merchant_ratio=MERCHANT_RATIO,
+):
+    """
+    Run the import, classification and export scenarios for each size and
+    return the results with a description of the environment.
+    """
+    results = []
+
+    for rows in sizes:
+        with tempfile.NamedTemporaryFile("w", newline="", suffix=".csv") as csv_file:
+            write_n26_csv(csv_file, rows, merchant_ratio=merchant_ratio)
+            csv_file.flush()
+
+            with override_settings(OLLAMA_ENABLE=False):
+                user, account = create_account(f"benchmark-import-{rows}")
+                results.append(
+                    measure(
+                        "import",
+                        rows,
+                        lambda: import_file(user, account, csv_file.name),
+                        trace_memory,
+                    )
+                )
+                results.append(
+                    measure("export", rows, lambda: export_user(user), trace_memory)
+                )
+
+            if with_ollama:
+                with (
+                    OllamaStub(latency=ollama_latency) as stub,
+                    override_settings(
+                        OLLAMA_ENABLE=True,
+                        OLLAMA_API_URL=stub.url,
+                        LOCAL_CLASSIFIER_ENABLE=False,
+                    ),
+                ):
+                    prediction_cache.memory_cache.data.clear()
+                    user, account = create_account(f"benchmark-classify-{rows}")
+                    result = measure(
+                        "import_ollama",
+                        rows,
+                        lambda: import_file(user, account, csv_file.name),
+                        trace_memory,
+                    )
+                    result["ollama_calls"] = stub.calls
+                    results.append(result)
+
+    return {
+        "environment": {
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "ollama_latency": ollama_latency,
+            "merchant_ratio": merchant_ratio,
+            "trace_memory": trace_memory,
+            "date": timezone.now().isoformat(),
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline run. Returns one line per scenario and the
+    list of scenarios whose wall time or query count grew beyond `tolerance`.
+    """
+    previous = {(item["name"], item["rows"]): item for item in baseline["results"]}
+    lines = []
+    regressions = []
+
+    for item in results["results"]:
+        base = previous.get((item["name"], item["rows"]))
+        if not base:
+            continue
+
+        time_ratio = item["seconds"] / base["seconds"] if base["seconds"] else 1.0
+        query_ratio = item["queries"] / base["queries"] if base["queries"] else 1.0
+        label = f"{item['name']} @ {item['rows']} rows"
+        lines.append(f"{label}: time x{time_ratio:.2f}, queries x{query_ratio:.2f}")
+        if time_ratio > 1 + tolerance or query_ratio > 1 + tolerance:
+            regressions.append(label)
+
+    return lines, regressions
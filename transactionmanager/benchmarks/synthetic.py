@@ -0,0 +1,99 @@
+import csv
+import random
+from datetime import date, timedelta
+
+from ..importers.n26_importer import N26Importer
+
+HEADER = [
+    "Booking Date",
+    "Value Date",
+    "Partner Name",
+    "Partner Iban",
+    "Type",
+    "Payment Reference",
+    "Account Name",
+    "Amount (EUR)",
+    "Original Amount",
+    "Original Currency",
+    "Exchange Rate",
+]
+MERCHANTS = [
+    ("ESSELUNGA", "Debit Card", -1),
+    ("CONAD", "Debit Card", -1),
+    ("ENEL ENERGIA", "Direct Debit", -1),
+    ("NETFLIX", "Debit Card", -1),
+    ("BAR CENTRALE", "Debit Card", -1),
+    ("TRENITALIA", "Debit Card", -1),
+    ("AMAZON", "Debit Card", -1),
+    ("FARMACIA COMUNALE", "Debit Card", -1),
+    ("ACME SPA", "Credit Transfer", 1),
+    ("MARCO ROSSI", "Debit Transfer", -1),
+]
+# Distinct merchants per row of a synthetic export, so the prediction cache
+# sees a realistic number of new merchants instead of the same ten
+MERCHANT_RATIO = 0.1
+
+
+def merchant_suffix(number):
+    """
+    Spell a number with letters (0 -> "A", 25 -> "Z", 26 -> "AA", ...): the
+    merchant normalization drops digits, so a numeric suffix would not tell
+    merchants apart.
+    """
+    letters = ""
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def merchant(number):
+    """
+    Return the (partner name, N26 type, amount sign) of the n-th merchant,
+    built on one of MERCHANTS followed by a suffix unique to the merchant.
+    """
+    partner, kind, sign = MERCHANTS[number % len(MERCHANTS)]
+    return f"{partner} {merchant_suffix(number // len(MERCHANTS))}", kind, sign
+
+
+def generate_n26_rows(
+    rows, seed=0, start=date(2020, 1, 1), merchant_ratio=MERCHANT_RATIO
+):
+    """
+    Yield `rows` synthetic N26 CSV rows, laid out as N26Importer.CSV_FIELDS.
+    The rows are spread over `rows * merchant_ratio` distinct merchants.
+    """
+    fields = N26Importer.CSV_FIELDS
+    rng = random.Random(seed)
+    merchants = max(1, round(rows * merchant_ratio))
+
+    for index in range(rows):
+        partner, kind, sign = merchant(rng.randrange(merchants))
+        booking_date = (start + timedelta(days=index // 20)).isoformat()
+        amount = sign * rng.randint(100, 50000) / 100
+
+        row = [""] * len(fields)
+        row[fields["booking_date"]] = booking_date
+        row[fields["value_date"]] = booking_date
+        row[fields["partner_name"]] = partner
+        row[fields["partner_iban"]] = (
+            f"IT60X054281110100000{index % 1000:07d}"
+            if kind.endswith("Transfer")
+            else ""
+        )
+        row[fields["type"]] = kind
+        row[fields["payment_ref"]] = f"Pagamento {index}"
+        row[fields["account_name"]] = "Main Account"
+        row[fields["amount"]] = f"{amount:.2f}"
+        yield row
+
+
+def write_n26_csv(file, rows, seed=0, merchant_ratio=MERCHANT_RATIO):
+    """
+    Write a synthetic N26 export with a header and `rows` transactions to a
+    text file opened with newline="".
+    """
+    writer = csv.writer(file)
+    writer.writerow(HEADER)
+    writer.writerows(generate_n26_rows(rows, seed=seed, merchant_ratio=merchant_ratio))
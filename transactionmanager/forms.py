@@ -1,31 +1,124 @@
+import logging
+
 from django import forms
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
-from .models import BANK_CHOICES, BankAccount
+from .models import BANK_CHOICES, BankAccount, Category, Transaction
+from .services.transactions import decode_cursor
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """
+    File field accepting several files, cleaned into a list.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(item, initial) for item in data]
+        return [single_file_clean(data, initial)]
+
 
 class CSVImportForm(forms.Form):
-    file = forms.FileField(
-        label="File CSV",
-        widget=forms.ClearableFileInput(attrs={"class": "form-control"}),
+    file = MultipleFileField(
+        label="File CSV o ZIP",
+        widget=MultipleFileInput(attrs={"class": "form-control"}),
     )
     account = forms.ModelChoiceField(
         queryset=BankAccount.objects.none(),
         label="Account",
         widget=forms.Select(attrs={"class": "form-select"}),
     )
+    preview = forms.BooleanField(
+        required=False,
+        label="Mostra un'anteprima prima di salvare",
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"}),
+    )
 
-    def __init__(self, *args, user=None, **kwargs):
+    def __init__(self, *args, user=None, bank_types=None, **kwargs):
         super().__init__(*args, **kwargs)
         if user:
+            if bank_types is None:
+                bank_types = [choice[0] for choice in BANK_CHOICES]
             self.fields["account"].queryset = BankAccount.objects.filter(
-                user=user, bank_type__in=[choice[0] for choice in BANK_CHOICES]
+                user=user, bank_type__in=bank_types
             )
+            logger.debug("Bank types of the import accounts: %s", ", ".join(bank_types))
+
+
+class TransactionFilterForm(forms.Form):
+    """
+    Filters and position of a page of the transactions of an account, read
+    from the query string.
+    """
+
+    category = forms.ModelChoiceField(
+        queryset=Category.objects.none(),
+        required=False,
+        label="Categoria",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    txn_type = forms.ChoiceField(
+        choices=[
+            ("", "Tutti i tipi"),
+            *Transaction._meta.get_field("txn_type").choices,
+        ],
+        required=False,
+        label="Tipo",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    date_from = forms.DateField(
+        required=False,
+        label="Dal",
+        widget=forms.DateInput(attrs={"class": "form-control", "type": "date"}),
+    )
+    date_to = forms.DateField(
+        required=False,
+        label="Al",
+        widget=forms.DateInput(attrs={"class": "form-control", "type": "date"}),
+    )
+    cursor = forms.CharField(required=False, widget=forms.HiddenInput)
+    limit = forms.IntegerField(
+        required=False, min_value=1, max_value=500, widget=forms.HiddenInput
+    )
 
-            print(self.fields["account"].queryset.first().bank_type)
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields["category"].queryset = Category.objects.filter(
+                created_by=user
+            ).order_by("txn_type", "name")
+
+    def clean_cursor(self):
+        cursor = self.cleaned_data.get("cursor")
+        if not cursor:
+            return None
+        try:
+            return decode_cursor(cursor)
+        except ValueError:
+            raise ValidationError("Cursore non valido.")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get("date_from")
+        date_to = cleaned_data.get("date_to")
+        if date_from and date_to and date_from > date_to:
+            raise ValidationError("La data iniziale deve precedere quella finale.")
+        return cleaned_data
 
 
 class UserProfileForm(forms.ModelForm):
@@ -103,7 +196,9 @@ class SetMainAccountForm(forms.Form):
         Set the selected account as the main account for the user.
         """
         # Remove the 'main' status from all user accounts
-        BankAccount.objects.filter(user=self.user).update(main_account=False)
+        BankAccount.objects.filter(user=self.user, main_account=True).update(
+            main_account=False, updated_at=timezone.now()
+        )
         # Imposta il nuovo conto principale
         account = BankAccount.objects.get(
             pk=self.cleaned_data["account_id"], user=self.user
@@ -1,25 +1,73 @@
-import csv
-import io
+import json
+import logging
+import zipfile
 from abc import ABC
-from datetime import datetime
-
-from ..models import BankAccount, Category, Transaction
+from collections import Counter, namedtuple
+from decimal import Decimal
+from time import perf_counter
 
 import requests
-
 from django.conf import settings
+from django.db import connection, transaction
+
+from ..models import BankAccount, ImportedFile, Transaction
+from ..services.data_version import bump_data_version
+from ..services.local_classifier import load_classifier, save_classifier
+from ..services.metrics import OPERATIONS, PREDICTIONS, ROWS, StageTimer, log_event
+from ..services.ollama_client import CircuitOpenError, OllamaClient
+from ..services.prediction_cache import PredictionCache, prediction_keys
+from ..services.reconciliation import reconcile_transfers
+from ..services.rollups import RollupDeltas
+from ..utils.fingerprint import RowsDigest, transaction_fingerprint
+from .columns import Columns
+from .reader import archive_members, is_archive, iter_archive_rows, iter_csv_rows
+from .resolver import ImportResolver
+
+logger = logging.getLogger(__name__)
+
+# A parsed and classified row of a dry run, kept until the preview is confirmed
+PreviewRow = namedtuple(
+    "PreviewRow",
+    [
+        "date",
+        "amount",
+        "txn_type",
+        "description",
+        "category",
+        "transfer_iban",
+        "transfer_name",
+        "fingerprint",
+        "learnable",
+    ],
+)
+
 
 class BaseBankImporter(ABC):
     BANK_NAME = "Base Bank"
     EXAMPLES_PER_CATEGORY = {
         "Entrata": [
-                "BONIFICO DA: MARCO ROSSI", "BONIFICO UNICREDIT", "INCASSO FATTURA", "ACCREDITO PAGA",
-                "DONAZIONE LIBERA", "PAGAMENTO DA CLIENTE", "VENDITA EBAY", "RICARICA HYPE",
-                "GIROCONTO ENTRATA", "RIMBORSO SPESE"
+            "BONIFICO DA: MARCO ROSSI",
+            "BONIFICO UNICREDIT",
+            "INCASSO FATTURA",
+            "ACCREDITO PAGA",
+            "DONAZIONE LIBERA",
+            "PAGAMENTO DA CLIENTE",
+            "VENDITA EBAY",
+            "RICARICA HYPE",
+            "GIROCONTO ENTRATA",
+            "RIMBORSO SPESE",
         ],
         "Uscita": [
-                "ENEL SERVIZIO ELETTRICO", "HERA GAS E LUCE", "AFFITTO MENSILE", "CONDOMINIO SPA",
-                "FASTWEB CASA", "ACQUA HERA", "VODAFONE CASA", "LUCE E GAS AXPO", "IMU COMUNE DI MILANO", "TASSA RIFIUTI DOMESTICA"
+            "ENEL SERVIZIO ELETTRICO",
+            "HERA GAS E LUCE",
+            "AFFITTO MENSILE",
+            "CONDOMINIO SPA",
+            "FASTWEB CASA",
+            "ACQUA HERA",
+            "VODAFONE CASA",
+            "LUCE E GAS AXPO",
+            "IMU COMUNE DI MILANO",
+            "TASSA RIFIUTI DOMESTICA",
         ],
     }
     CATEGORIES = {
@@ -34,175 +82,788 @@ class BaseBankImporter(ABC):
         "amount": 3,
         "currency": 4,
     }
+    # Fields parsed into the typed `amounts` and `dates` columns
+    AMOUNT_FIELD = "amount"
+    DATE_FIELD = "date"
+    DATE_FORMAT = "%Y-%m-%d"
+    FALLBACK_CATEGORY = "Altro"
+    # Candidate encodings of the exported CSV: each one but the last is tried in
+    # order with a strict decode of the whole file, the first that succeeds is used
+    ENCODINGS = ("ISO-8859-1",)
 
-    def __init__(self, user, file, iban=None):
+    def __init__(
+        self,
+        user,
+        file,
+        iban=None,
+        batch_size=None,
+        progress=None,
+        dry_run=False,
+        previewed=None,
+    ):
         self.user = user
         self.file = file
         self.iban = iban
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.progress = progress
+        # With dry_run nothing is written: the new rows are kept in preview_rows
+        self.dry_run = dry_run
+        self.preview_rows = []
+        # Rows of a confirmed dry run, written instead of reading the file
+        self.previewed = previewed
+        self.resolver = None
+        self.prediction_cache = None
+        self.local_classifier = None
+        self.client = None
+        self.stats = None
+        self.files = 1
+        # Running digest of the rows read, checkpointed at every batch boundary
+        self.digest = RowsDigest()
+        self.checkpoints = {}
+        self.imported_checkpoints = set()
+        # Dates of the first and last transactions inserted, bounding the reconciliation
+        self.inserted_dates = None
 
     def create_bank_categories(self):
         """
         Create default categories for the bank if they do not exist."""
-        for name, data in self.CATEGORIES.items():
-            Category.objects.get_or_create(
-                name=name,
-                icon=data["icon"],
-                importer=self.BANK_NAME,
-                txn_type="IN" if data["is_income"] else "OUT",
-                created_by=self.user,
-            )
+        self.resolver.ensure_categories(self.CATEGORIES)
 
     def get_or_create_main_account(self):
         """
         Get or create the main bank account for the user based on the IBAN.
         """
-        account = BankAccount.objects.filter(iban=self.iban, user=self.user).first()
+        account = self.resolver.get_account(self.iban)
         if not account:
-            account = BankAccount.objects.create(user=self.user, iban=self.iban, name=self.BANK_NAME)
+            account = BankAccount(user=self.user, iban=self.iban, name=self.BANK_NAME)
+            if not self.dry_run:
+                account.save()
+            self.resolver.accounts[self.iban] = account
         return account
 
-    def get_description(self, row):
+    def parse_columns(self, rows):
+        """
+        Parse a chunk of CSV rows into typed columns in a single pass, drop the
+        invalid rows and add the derived columns used by the rest of the import.
+        Returns the columns and the number of invalid rows.
+        """
+        columns = Columns(
+            rows, self.CSV_FIELDS, self.AMOUNT_FIELD, self.DATE_FIELD, self.DATE_FORMAT
+        )
+        skipped = columns.compress()
+        columns.txn_types = self.get_transaction_types(columns)
+        columns.descriptions = self.get_descriptions(columns)
+        return columns, skipped
+
+    def get_descriptions(self, columns):
         """
-        Get the transaction description from the CSV row or return a default value if empty.
+        Get the transaction descriptions, or a default value where empty.
         """
-        description = row[self.CSV_FIELDS["description"]].strip()
-        return description if description else "No description"
+        return [
+            description.strip() or "No description"
+            for description in columns["description"]
+        ]
 
-    def get_transaction_type(self, row, amount):
+    def get_transaction_types(self, columns):
         """
-        Determine the transaction type based on the amount.
+        Determine the transaction types based on the amounts.
         If the amount is positive, it's an income; if negative, it's an expense.
         """
-        if amount >= 0:
-            return "IN"
-        return "OUT"
+        return ["IN" if amount >= 0 else "OUT" for amount in columns.amounts]
+
+    def get_transfer_accounts(self, columns):
+        """
+        Get the transfer account of each row, None when it is not a transfer.
+        """
+        return [None] * len(columns)
 
-    def get_transfer_account(self, row):
+    def get_prediction_keys(self, columns):
         """
-        Get the transfer account based on the partner name in the CSV row.
-        If no partner name is provided, return None.
+        Get the keys under which the predicted categories of the rows are cached:
+        the transaction type and the normalized description. The key is None for
+        the rows carrying no usable merchant information.
         """
-        return None
-    
+        return prediction_keys(columns.txn_types, columns["description"])
+
+    def get_partner_ibans(self, columns):
+        """
+        Get the IBAN of the counterpart of each transaction, if the bank exports it.
+        """
+        return [""] * len(columns)
+
     def import_transactions(self):
         """
         Import transactions from the CSV file.
-        This method reads the CSV content, processes each row, and creates Transaction objects.
+        Rows are parsed into unsaved Transaction objects and written in batches of
+        `batch_size`: each batch looks up the already imported rows with a single
+        query and bulk-inserts only the new ones.
         It also creates default categories if they do not exist.
+        The file can also be a ZIP archive of CSV files, imported together as a
+        single batch: rows repeated across files are stored once.
+        Each batch of rows is parsed into typed columns in one pass; rows whose
+        amount or date cannot be parsed are skipped.
+        Returns the number of parsed, classified, inserted, duplicate and skipped
+        (invalid) rows; the same counters are reported to the `progress` callback
+        after every batch.
+        The digest of the rows read so far is checkpointed after every batch and
+        stored with the import: batches whose checkpoint matches one of an
+        earlier import of the account are skipped without being parsed or
+        classified, so an identical file costs only its reading and an
+        overlapping one only its new rows.
+        With `dry_run` nothing is written: the new rows are returned under
+        "preview_rows" with a summary under "preview", and can be written later
+        by an importer created with `previewed=preview_rows`, which neither reads
+        the file nor classifies the rows again.
+        The time and the queries spent in each stage are returned under "timings",
+        logged and added to the process metrics.
         """
+        self.stats = StageTimer("import")
+        start = perf_counter()
 
-        # Ensure categories are created before importing transactions
-        self.create_bank_categories()
+        with connection.execute_wrapper(self.stats):
+            result = self.run_stages()
 
-        # Read the CSV content
-        rows = self.read_csv_content()
+        seconds = perf_counter() - start
+        result["timings"] = self.stats.as_dict()
+        result["seconds"] = round(seconds, 4)
+        result["rows_per_second"] = (
+            round(result["parsed"] / seconds, 1) if seconds else None
+        )
+        self.publish_metrics(result)
+        return result
 
-        for row in rows:
-            if not self.is_valid_row(row):
-                continue
+    def run_stages(self):
+        """
+        Run the stages of the import: setup, then CSV parsing, classification,
+        category resolution and writing for every batch, then finish.
+        """
+        with self.stats.stage("setup"):
+            # Load the user's accounts and categories once for the whole import
+            self.resolver = ImportResolver(
+                self.user, self.BANK_NAME, dry_run=self.dry_run
+            )
+            self.prediction_cache = PredictionCache(self.user, self.BANK_NAME)
+            if settings.LOCAL_CLASSIFIER_ENABLE:
+                self.local_classifier = load_classifier(
+                    self.user,
+                    self.BANK_NAME,
+                    self.CATEGORIES,
+                    self.EXAMPLES_PER_CATEGORY,
+                    self.FALLBACK_CATEGORY,
+                )
 
-            amount = self.get_amount(row)
-            description = self.get_description(row)
-            txn_type = self.get_transaction_type(row, amount)
-            date = self.get_date(row)
+            # Ensure categories are created before importing transactions
+            self.create_bank_categories()
+
+            # Read the CSV content, unless the rows come from a confirmed preview
+            rows = self.read_csv_content() if self.previewed is None else []
 
             account = self.get_or_create_main_account()
-            transfer_account = self.get_transfer_account(row)
-            category = self.get_category(row)
-
-            Transaction.objects.get_or_create(
-                bank_account=account,
-                transfer_account=transfer_account,
-                amount=abs(amount),
-                txn_type=txn_type,
-                date=date,
-                description=description,
-                category=category,
+            if account.pk and self.previewed is None:
+                self.imported_checkpoints = {
+                    (int(rows), digest)
+                    for checkpoints in ImportedFile.objects.filter(
+                        bank_account=account
+                    ).values_list("checkpoints", flat=True)
+                    for rows, digest in checkpoints.items()
+                }
+
+        result = {
+            "parsed": 0,
+            "classified": 0,
+            "inserted": 0,
+            "duplicates": 0,
+            "skipped": 0,
+            "previously_imported": 0,
+            "transfers_linked": 0,
+            "local_hits": 0,
+            "ollama_unavailable": False,
+        }
+        seen = set()
+        batch = []
+
+        try:
+            if self.previewed is not None:
+                for start in range(0, len(self.previewed), self.batch_size):
+                    self.import_previewed_batch(
+                        account,
+                        self.previewed[start : start + self.batch_size],
+                        seen,
+                        result,
+                    )
+
+            for row in self.stats.timed("parse", rows):
+                result["parsed"] += 1
+                self.digest.update(row)
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self.import_or_skip_batch(account, batch, seen, result)
+                    batch = []
+
+            if batch:
+                self.import_or_skip_batch(account, batch, seen, result)
+        finally:
+            if self.client:
+                result["ollama_unavailable"] = self.client.breaker.is_open
+                self.client.close()
+                self.client = None
+
+        if result["inserted"]:
+            with self.stats.stage("reconcile"):
+                result["transfers_linked"] = reconcile_transfers(
+                    self.user,
+                    accounts=[account.pk],
+                    date_from=self.inserted_dates[0],
+                    date_to=self.inserted_dates[1],
+                )
+
+        with self.stats.stage("finish"):
+            self.report_progress(result)
+
+            if not self.dry_run:
+                # Rows are bulk-inserted without signals, so cached exports are invalidated here
+                bump_data_version(self.user.pk)
+                self.record_file(account, result)
+
+                if self.local_classifier:
+                    save_classifier(self.user, self.BANK_NAME, self.local_classifier)
+
+        if self.dry_run:
+            result["preview"] = self.preview_summary()
+            result["preview_rows"] = self.preview_rows
+
+        result["files"] = self.files
+        result["cache_hits"] = self.prediction_cache.hits
+        result["cache_misses"] = self.prediction_cache.misses
+        result["categories"] = self.CATEGORIES
+        return result
+
+    def publish_metrics(self, result):
+        """
+        Add the import to the process metrics and log a structured summary line.
+        """
+        self.stats.publish()
+        OPERATIONS.inc(operation="import", bank=self.BANK_NAME)
+        for outcome in ("inserted", "duplicates", "skipped"):
+            ROWS.inc(
+                result[outcome],
+                operation="import",
+                bank=self.BANK_NAME,
+                outcome=outcome,
             )
 
-        return {"categories": self.CATEGORIES}
+        stages = {}
+        for stage, timing in result["timings"].items():
+            stages[f"{stage}_seconds"] = timing["seconds"]
+            stages[f"{stage}_queries"] = timing["queries"]
 
-    def read_csv_content(self):
+        log_event(
+            logger,
+            "import_finished",
+            bank=self.BANK_NAME,
+            user=self.user.pk,
+            files=result["files"],
+            parsed=result["parsed"],
+            inserted=result["inserted"],
+            duplicates=result["duplicates"],
+            skipped=result["skipped"],
+            transfers_linked=result["transfers_linked"],
+            cache_hits=result["cache_hits"],
+            local_hits=result["local_hits"],
+            ollama_unavailable=result["ollama_unavailable"],
+            seconds=result["seconds"],
+            rows_per_second=result["rows_per_second"],
+            **stages,
+        )
+
+    def import_or_skip_batch(self, account, rows, seen, result):
         """
-        Read the CSV content from the file and return a CSV reader object.
+        Import a batch of CSV rows, unless all the rows read so far are the
+        leading rows of a file already imported on the account.
         """
-        content = self.file.read().decode("ISO-8859-1")
-        reader = csv.reader(io.StringIO(content))
-        next(reader)    # Skip header row
-        return reader
+        checkpoint = (result["parsed"], self.digest.hexdigest())
+        self.checkpoints[str(checkpoint[0])] = checkpoint[1]
 
-    def is_valid_row(self, row):
+        # Only a leading section can match: once a batch differs, the rest is new
+        if checkpoint in self.imported_checkpoints:
+            # Invalid rows were skipped, not imported, the first time too
+            with self.stats.stage("parse"):
+                columns, skipped = self.parse_columns(rows)
+            result["skipped"] += skipped
+            result["duplicates"] += len(columns)
+            result["previously_imported"] += len(columns)
+            self.report_progress(result)
+            return
+        self.imported_checkpoints = set()
+
+        self.import_batch(account, rows, seen, result)
+
+    def record_file(self, account, result):
         """
-        Validate the CSV row by checking required fields.
+        Store the digest and the checkpoints of the imported file.
         """
-        try:
-            self.get_amount(row)
-            return True
-        except Exception:
-            return False
+        if not self.checkpoints:
+            return
+        ImportedFile.objects.update_or_create(
+            bank_account=account,
+            digest=self.digest.hexdigest(),
+            defaults={"rows": result["parsed"], "checkpoints": self.checkpoints},
+        )
 
-    def get_amount(self, row):
+    def import_batch(self, account, rows, seen, result):
         """
-        Parse the amount from the CSV row.
-        The amount is expected to be in the specified field and should be a valid float with dots as decimal separators.
+        Parse a batch of CSV rows into columns, classify the valid ones, then
+        write the resulting transactions.
         """
-        return float(row[self.CSV_FIELDS["amount"]])
+        with self.stats.stage("parse"):
+            columns, skipped = self.parse_columns(rows)
+        result["skipped"] += skipped
+        if not len(columns):
+            return
 
-    def get_date(self, row):
+        with self.stats.stage("classify"):
+            names, learnable = self.classify_rows(columns, result)
+
+        with self.stats.stage("resolve"):
+            batch = self.build_transactions(columns, account, names)
+        result["classified"] += len(batch)
+
+        self.store_batch(account, batch, learnable, seen, result)
+
+    def import_previewed_batch(self, account, rows, seen, result):
         """
-        Get the transaction date from the CSV row.
+        Rebuild the transactions of a batch of confirmed preview rows and write them.
         """
-        return datetime.strptime(row[self.CSV_FIELDS["date"]], "%Y-%m-%d")
+        with self.stats.stage("resolve"):
+            batch = []
+            for row in rows:
+                transfer_account = None
+                if row.transfer_iban:
+                    transfer_account = self.resolver.get_account(
+                        row.transfer_iban
+                    ) or self.resolver.add_account(row.transfer_iban, row.transfer_name)
+                batch.append(
+                    Transaction(
+                        bank_account=account,
+                        transfer_account=transfer_account,
+                        amount=row.amount,
+                        txn_type=row.txn_type,
+                        date=row.date,
+                        description=row.description,
+                        category=self.get_category(None, name=row.category),
+                        fingerprint=row.fingerprint,
+                    )
+                )
+        result["parsed"] += len(rows)
+        result["classified"] += len(batch)
 
-    def get_category(self,row,name=None,model="llama3",examples_per_category=None,fallback="Altro", categories=None):
+        self.store_batch(account, batch, [row.learnable for row in rows], seen, result)
+
+    def store_batch(self, account, batch, learnable, seen, result):
+        """
+        Write the new transactions of a batch, or keep them as preview rows
+        with `dry_run`, then let the local classifier learn from them.
+        """
+        with self.stats.stage("write"):
+            if self.dry_run:
+                new = self.find_new(account, batch, seen, result)
+            else:
+                new = self.write_batch(account, batch, seen, result)
+
+                # Rows are bulk-inserted without signals, so cached exports are invalidated here
+                bump_data_version(self.user.pk)
+            self.report_progress(result)
+
+        learn = {id(txn) for txn, flag in zip(batch, learnable) if flag}
+        if self.dry_run:
+            self.preview_rows.extend(
+                PreviewRow(
+                    txn.date,
+                    txn.amount,
+                    txn.txn_type,
+                    txn.description,
+                    txn.category.name,
+                    txn.transfer_account.iban if txn.transfer_account else "",
+                    txn.transfer_account.name if txn.transfer_account else "",
+                    txn.fingerprint,
+                    id(txn) in learn,
+                )
+                for txn in new
+            )
+        elif self.local_classifier:
+            for txn in new:
+                if id(txn) in learn:
+                    self.local_classifier.learn(
+                        txn.description, txn.txn_type, txn.category.name
+                    )
+
+    def preview_summary(self):
+        """
+        Summary of the rows of a dry run: how many would be written, by category
+        and type, and their date range.
+        """
+        rows = self.preview_rows
+        return {
+            "new": len(rows),
+            "categories": dict(Counter(row.category for row in rows).most_common()),
+            "types": dict(Counter(row.txn_type for row in rows)),
+            "first_date": min(row.date for row in rows).date().isoformat()
+            if rows
+            else None,
+            "last_date": max(row.date for row in rows).date().isoformat()
+            if rows
+            else None,
+        }
+
+    def classify_rows(self, columns, result):
+        """
+        Return the category name of each parsed row (None when it is unknown) and
+        whether the local classifier may learn from it.
+        Merchants already classified are served by the prediction cache, then the
+        local classifier answers for the rows it is confident about. Only the
+        remaining rows are sent to the language model, once per distinct
+        merchant, and its valid answers are cached for the next imports.
+        """
+        keys = self.get_prediction_keys(columns)
+        cached = self.prediction_cache.get_many({key for key in keys if key})
+        names = [cached.get(key) for key in keys]
+        learnable = [name is not None for name in names]
+        PREDICTIONS.inc(sum(learnable), source="cache")
+
+        if self.local_classifier:
+            for index, (description, txn_type) in enumerate(
+                zip(columns.descriptions, columns.txn_types)
+            ):
+                if names[index] is None:
+                    names[index] = self.local_classifier.classify(description, txn_type)
+                    if names[index] is not None:
+                        result["local_hits"] += 1
+                        PREDICTIONS.inc(source="local")
+
+        if settings.OLLAMA_ENABLE:
+            pending = {}
+            for index, key in enumerate(keys):
+                if names[index] is None:
+                    pending.setdefault(key or index, []).append(index)
+
+            if pending:
+                predicted = self.predict_categories(
+                    [columns.rows[indexes[0]] for indexes in pending.values()]
+                )
+                self.prediction_cache.set_many(
+                    {
+                        key: name
+                        for key, name in zip(pending, predicted)
+                        if isinstance(key, str) and name in self.CATEGORIES
+                    }
+                )
+                for indexes, name in zip(pending.values(), predicted):
+                    for index in indexes:
+                        names[index] = name
+                        learnable[index] = name in self.CATEGORIES
+                    if name in self.CATEGORIES:
+                        PREDICTIONS.inc(len(indexes), source="ollama")
+
+        PREDICTIONS.inc(
+            sum(name not in self.CATEGORIES for name in names), source="fallback"
+        )
+        return names, learnable
+
+    def report_progress(self, result):
+        """
+        Notify the progress callback, if any, of the rows processed so far.
+        """
+        if self.progress:
+            self.progress(
+                parsed=result["parsed"],
+                classified=result["classified"],
+                written=result["inserted"],
+            )
+
+    def build_transactions(self, columns, account, names):
+        """
+        Build the unsaved Transaction objects of the parsed rows.
+        `names` are the categories already predicted for the rows: an empty or
+        unknown name selects the fallback category without asking the model again.
+        """
+        transfer_accounts = self.get_transfer_accounts(columns)
+        partner_ibans = self.get_partner_ibans(columns)
+
+        transactions = []
+        for index, row in enumerate(columns.rows):
+            amount = columns.amounts[index]
+            date = columns.dates[index]
+            txn_type = columns.txn_types[index]
+            description = columns.descriptions[index]
+            transactions.append(
+                Transaction(
+                    bank_account=account,
+                    transfer_account=transfer_accounts[index],
+                    amount=abs(amount).quantize(Decimal("0.01")),
+                    txn_type=txn_type,
+                    date=date,
+                    description=description,
+                    category=self.get_category(row, name=names[index] or ""),
+                    fingerprint=transaction_fingerprint(
+                        date, amount, txn_type, description, partner_ibans[index]
+                    ),
+                )
+            )
+        return transactions
+
+    @staticmethod
+    def legacy_fingerprint(txn):
+        """
+        Fingerprint that the backfill migration assigned to transactions imported
+        before fingerprints existed, when the partner IBAN was not stored.
+        """
+        return transaction_fingerprint(
+            txn.date,
+            txn.amount,
+            txn.txn_type,
+            txn.description,
+            txn.transfer_account.iban if txn.transfer_account else "",
+        )
+
+    def find_new(self, account, batch, seen, result):
+        """
+        Return the transactions of a batch that are not already stored nor seen
+        earlier in the import, counting the others as duplicates.
+        Existing rows are matched by fingerprint with one indexed query per batch.
+        """
+        legacy = {txn.fingerprint: self.legacy_fingerprint(txn) for txn in batch}
+
+        stored = set()
+        if account.pk:
+            stored = set(
+                Transaction.objects.filter(
+                    bank_account=account,
+                    fingerprint__in=set(legacy) | set(legacy.values()),
+                ).values_list("fingerprint", flat=True)
+            )
+
+        new = []
+        for txn in batch:
+            if (
+                txn.fingerprint in seen
+                or txn.fingerprint in stored
+                or legacy[txn.fingerprint] in stored
+            ):
+                result["duplicates"] += 1
+                continue
+            seen.add(txn.fingerprint)
+            new.append(txn)
+        return new
+
+    def write_batch(self, account, batch, seen, result):
+        """
+        Insert the transactions of a batch that are not already stored.
+        New rows are written with a single bulk_create inside an atomic block,
+        together with their totals in the monthly rollups.
+        The account is locked first, so the batches of concurrent imports of
+        the same account run one after the other: each one sees the rows
+        inserted by the previous ones, and every row of `new` is inserted, so
+        none is counted twice in the rollups.
+        Returns the inserted transactions.
+        """
+        with transaction.atomic():
+            BankAccount.objects.select_for_update().only("pk").get(pk=account.pk)
+            # Transfer accounts discovered in this batch must exist before the rows
+            self.resolver.flush()
+
+            new = self.find_new(account, batch, seen, result)
+            Transaction.objects.bulk_create(new, batch_size=self.batch_size)
+
+            deltas = RollupDeltas()
+            for txn in new:
+                deltas.add_transaction(txn)
+            deltas.apply()
+
+        result["inserted"] += len(new)
+        if new:
+            dates = [txn.date for txn in new]
+            if self.inserted_dates:
+                dates.extend(self.inserted_dates)
+            self.inserted_dates = (min(dates), max(dates))
+        return new
+
+    def read_csv_content(self):
+        """
+        Return a generator over the CSV rows of the file, header excluded.
+        The file is decoded chunk by chunk, so memory usage does not depend on
+        its size.
+        """
+        if is_archive(self.file):
+            return self.read_archive_content()
+        return iter_csv_rows(self.file, self.ENCODINGS)
+
+    def read_archive_content(self):
+        """
+        Generator over the rows of all the CSV files of a ZIP archive, in archive
+        order. Members are decompressed one at a time, chunk by chunk, within
+        the IMPORT_ARCHIVE_MAX_FILES and IMPORT_ARCHIVE_MAX_BYTES limits.
+        """
+        with zipfile.ZipFile(self.file) as archive:
+            members = archive_members(
+                archive,
+                settings.IMPORT_ARCHIVE_MAX_FILES,
+                settings.IMPORT_ARCHIVE_MAX_BYTES,
+            )
+            self.files = len(members)
+            yield from iter_archive_rows(
+                archive, members, self.ENCODINGS, settings.IMPORT_ARCHIVE_MAX_BYTES
+            )
+
+    def get_category(
+        self,
+        row,
+        name=None,
+        model="llama3",
+        examples_per_category=None,
+        fallback="Altro",
+        categories=None,
+    ):
         """
         Get or create a Category object based on a predicted or provided category name.
         """
         if name is None and settings.OLLAMA_ENABLE:
-            print(f"Predicting category for row: {row}")
+            logger.debug("Predicting category for row: %s", row)
             name = self.predict_category(
-                    row,
-                    examples_per_category=examples_per_category,
-                    model=model,
-                    categories=categories or self.CATEGORIES
+                row,
+                examples_per_category=examples_per_category,
+                model=model,
+                categories=categories or self.CATEGORIES,
             )
 
         final_name = name if name in self.CATEGORIES else fallback
         data = self.CATEGORIES.get(final_name)
 
-        category, _ = Category.objects.get_or_create(
-            name=final_name,
-            importer=self.BANK_NAME,
-            txn_type="IN" if data["is_income"] else "OUT",
-            created_by=self.user,
-            defaults={"icon": data["icon"]},
+        return self.resolver.get_category(
+            final_name, "IN" if data["is_income"] else "OUT", data["icon"]
         )
 
-        return category
+    def category_instructions(self, categories):
+        """
+        Instructions shared by the single and batch category prediction prompts.
+        """
+        return (
+            f"Categorie possibili: {', '.join(list(categories.keys()))}\n"
+            "Se l'importo è positivo è un'entrata, se negativo è un'uscita.\n"
+            "L'utente è una persona comune, con transazioni private, non aziendali.\n"
+            "Se riconosci che una categoria è una possibile entrata, allora considera che le categorie in entrata\n"
+            "sono "
+            + ", ".join(
+                [name for name, data in categories.items() if data["is_income"]]
+            )
+            + ".\n"
+            "Se riconosci che una categoria è una possibile uscita, allora considera che le categorie in uscita\n"
+            "sono "
+            + ", ".join(
+                [name for name, data in categories.items() if not data["is_income"]]
+            )
+            + ".\n"
+        )
 
+    def generate(self, prompt, model="llama3", response_format=None):
+        """
+        Send a prompt to Ollama through the import's pooled client.
+        """
+        if self.client is None:
+            self.client = OllamaClient()
+        return self.client.generate(
+            prompt, model=model, response_format=response_format
+        )
 
-    def predict_category(self, row, examples_per_category=None, model="llama3", categories=None):
+    def predict_category(
+        self, row, examples_per_category=None, model="llama3", categories=None
+    ):
         """
         Predict the category using a language model.
         """
         examples_per_category = examples_per_category or self.EXAMPLES_PER_CATEGORY
+        categories = categories or self.CATEGORIES
 
         prompt = (
             f"Questa è una transazione:\n{str(row)}\n\n"
-            f"Categorie possibili: {', '.join(list(categories.keys()))}\n"
             "Scegli la categoria più adatta. Rispondi solo con il nome esatto della categoria, senza spiegazioni.\n"
-            "Se l'importo è positivo è un'entrata, se negativo è un'uscita.\n"
-            "L'utente è una persona comune, con transazioni private, non aziendali.\n"
-            "Se riconosci che una categoria è una possibile entrata, allora considera che le categorie in entrata\n"
-            "sono " + ", ".join([name for name, data in categories.items() if data["is_income"]]) + ".\n"
-            "Se riconosci che una categoria è una possibile uscita, allora considera che le categorie in uscita\n"
-            "sono " + ", ".join([name for name, data in categories.items() if not data["is_income"]]) + ".\n"
+            + self.category_instructions(categories)
             # f"Ecco alcuni esempi:\n{examples_per_category}\n\n"
         )
-        print(f"Prompt for category prediction: {prompt}")
-        response = requests.post(
-            settings.OLLAMA_API_URL,
-            json={"model": model, "prompt": prompt, "stream": False},
+        logger.debug("Prompt for category prediction: %s", prompt)
+        return self.generate(prompt, model=model)
+
+    def predict_categories(self, rows, model="llama3", categories=None):
+        """
+        Predict the categories of many rows, sending `OLLAMA_BATCH_SIZE` numbered
+        transactions per prompt and asking for a JSON object mapping each number
+        to a category. Rows whose answer is missing or not a known category are
+        predicted again one at a time.
+        Prompts run concurrently on the Ollama client's thread pool.
+        Returns the predicted category names, in the same order as `rows`, with
+        None for the rows that could not be classified.
+        """
+        categories = categories or self.CATEGORIES
+        size = settings.OLLAMA_BATCH_SIZE
+        if self.client is None:
+            self.client = OllamaClient()
+
+        chunks = [rows[start : start + size] for start in range(0, len(rows), size)]
+        names = [
+            name
+            for answers in self.client.map(
+                lambda chunk: self.predict_chunk(chunk, model, categories), chunks
+            )
+            for name in answers
+        ]
+
+        failed = [index for index, name in enumerate(names) if name not in categories]
+        retried = self.client.map(
+            lambda index: self.predict_row(rows[index], model, categories), failed
         )
-        response.raise_for_status()
-        return response.json()["response"].strip()
+        for index, name in zip(failed, retried):
+            names[index] = name
+
+        return names
+
+    def predict_chunk(self, chunk, model, categories):
+        """
+        Ask the model for the categories of a chunk of rows in a single prompt.
+        Returns the answer for each row, None where it is missing or not a text.
+        """
+        transactions = "\n".join(
+            f"{index}. {str(row)}" for index, row in enumerate(chunk, start=1)
+        )
+        prompt = (
+            f"Queste sono {len(chunk)} transazioni numerate:\n{transactions}\n\n"
+            "Scegli la categoria più adatta per ognuna. Rispondi solo con un oggetto JSON "
+            "che associa il numero di ogni transazione al nome esatto della categoria, "
+            'ad esempio {"1": "Altro", "2": "Stipendio"}, senza spiegazioni.\n'
+            + self.category_instructions(categories)
+        )
+        logger.debug("Prompt for batch category prediction: %s", prompt)
+
+        try:
+            answers = json.loads(
+                self.generate(prompt, model=model, response_format="json")
+            )
+        except (ValueError, requests.RequestException, CircuitOpenError):
+            answers = {}
+        if not isinstance(answers, dict):
+            answers = {}
+
+        return [
+            answer if isinstance(answer, str) else None
+            for answer in (
+                answers.get(str(index)) for index in range(1, len(chunk) + 1)
+            )
+        ]
+
+    def predict_row(self, row, model, categories):
+        """
+        Predict the category of a single row, returning None if Ollama fails.
+        """
+        try:
+            name = self.predict_category(row, model=model, categories=categories)
+        except (requests.RequestException, CircuitOpenError):
+            return None
+        return name if name in categories else None
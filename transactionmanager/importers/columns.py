@@ -0,0 +1,97 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sys import intern
+
+from django.utils import timezone
+
+
+def parse_amounts(values, valid):
+    """
+    Parse a column of amounts into Decimals, clearing the validity of the rows
+    whose amount is missing or not a finite number.
+    """
+    amounts = []
+    for index, value in enumerate(values):
+        try:
+            amount = Decimal(value)
+        except InvalidOperation:
+            amount = None
+        if amount is None or not amount.is_finite():
+            valid[index] = False
+            amount = None
+        amounts.append(amount)
+    return amounts
+
+
+def parse_dates(values, date_format, valid):
+    """
+    Parse a column of dates into aware datetimes, clearing the validity of the
+    rows whose date cannot be parsed. Each distinct value is parsed once.
+    """
+    parsed = {}
+    dates = []
+    for index, value in enumerate(values):
+        if value not in parsed:
+            try:
+                date = datetime.strptime(value, date_format)
+                parsed[value] = (
+                    timezone.make_aware(date) if timezone.is_naive(date) else date
+                )
+            except ValueError:
+                parsed[value] = None
+        date = parsed[value]
+        if date is None:
+            valid[index] = False
+        dates.append(date)
+    return dates
+
+
+class Columns:
+    """
+    Typed columns of a chunk of CSV rows, built in a single pass.
+    Every CSV field is available as a column of interned strings (`columns[name]`),
+    the amount and date fields are also parsed into `amounts` (Decimal) and
+    `dates` (aware datetime), and `valid` is the mask of the rows that are
+    complete and whose amount and date could be parsed.
+    Importers add their derived columns (e.g. `txn_types`, `descriptions`) once
+    the invalid rows have been dropped with compress().
+    """
+
+    def __init__(self, rows, fields, amount_field, date_field, date_format):
+        width = max(fields.values()) + 1
+        self.rows = rows
+        self.valid = [len(row) >= width for row in rows]
+        self.text = {
+            name: [
+                intern(row[index]) if ok else "" for row, ok in zip(rows, self.valid)
+            ]
+            for name, index in fields.items()
+        }
+        self.amounts = parse_amounts(self.text[amount_field], self.valid)
+        self.dates = parse_dates(self.text[date_field], date_format, self.valid)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, name):
+        return self.text[name]
+
+    def compress(self):
+        """
+        Drop the invalid rows from every column.
+        Returns the number of dropped rows.
+        """
+        valid = self.valid
+        if all(valid):
+            return 0
+
+        def keep(column):
+            return [value for value, ok in zip(column, valid) if ok]
+
+        dropped = len(valid) - sum(valid)
+        self.rows = keep(self.rows)
+        self.text = {name: keep(column) for name, column in self.text.items()}
+        self.amounts = keep(self.amounts)
+        self.dates = keep(self.dates)
+        self.valid = [True] * len(self.rows)
+        return dropped
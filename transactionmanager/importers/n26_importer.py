@@ -1,6 +1,6 @@
+from ..services.prediction_cache import prediction_keys
 from .base_importer import BaseBankImporter
-from ..models import BankAccount
-from datetime import datetime
+
 
 class N26Importer(BaseBankImporter):
     BANK_NAME = "N26"
@@ -22,7 +22,10 @@ class N26Importer(BaseBankImporter):
         "Educazione": {"icon": "school", "is_income": False},
         "Famiglia & Amici": {"icon": "people", "is_income": False},
         "Cure sanitarie & Farmacia": {"icon": "local_hospital", "is_income": False},
-        "Tempo libero & Intrattenimento": {"icon": "sports_esports", "is_income": False},
+        "Tempo libero & Intrattenimento": {
+            "icon": "sports_esports",
+            "is_income": False,
+        },
         "Multimedia & Elettronica": {"icon": "devices", "is_income": False},
         "N26 sponsorizzazioni": {"icon": "star", "is_income": True},
         "Risparmio & Investimenti": {"icon": "trending_up", "is_income": False},
@@ -42,48 +45,66 @@ class N26Importer(BaseBankImporter):
         "original_currency": 9,
         "exchange_rate": 10,
     }
+    ENCODINGS = ("utf-8-sig", "ISO-8859-1")
+    DATE_FIELD = "booking_date"
 
+    def get_descriptions(self, columns):
+        descriptions = []
+        for partner, ref in zip(columns["partner_name"], columns["payment_ref"]):
+            ref = ref.strip()
+            descriptions.append(
+                f"{partner} | {ref}" if partner and ref else partner or ref
+            )
+        return descriptions
 
-    def get_description(self, row):
-        partner = row[self.CSV_FIELDS["partner_name"]]
-        ref = row[self.CSV_FIELDS["payment_ref"]].strip()
-        return f"{partner} | {ref}" if partner and ref else partner or ref
-
-    def get_transaction_type(self, row, amount):
-        txn_type_raw = row[self.CSV_FIELDS["type"]]
-        partner_name = row[self.CSV_FIELDS["partner_name"]]
-        if txn_type_raw == "Debit Transfer" and partner_name:
-            return "TRSF"
-        return "IN" if amount >= 0 else "OUT"
-
-    def get_transfer_account(self, row):
-        txn_type = self.get_transaction_type(row, float(row[self.CSV_FIELDS["amount"]]))
-        if txn_type != "TRSF":
-            return None
+    def get_transaction_types(self, columns):
+        return [
+            "TRSF"
+            if txn_type_raw == "Debit Transfer" and partner_name
+            else "IN"
+            if amount >= 0
+            else "OUT"
+            for txn_type_raw, partner_name, amount in zip(
+                columns["type"], columns["partner_name"], columns.amounts
+            )
+        ]
 
-        partner_iban = row[self.CSV_FIELDS["partner_iban"]]
-        partner_name = row[self.CSV_FIELDS["partner_name"]]
+    def get_transfer_accounts(self, columns):
+        owner = f"{self.user.first_name} {self.user.last_name}"
+        accounts = []
+        for txn_type, partner_iban, partner_name in zip(
+            columns.txn_types, columns["partner_iban"], columns["partner_name"]
+        ):
+            account = None
+            if txn_type == "TRSF":
+                account = self.resolver.get_account(partner_iban)
+                if not account and partner_name == owner:
+                    account = self.resolver.add_account(
+                        partner_iban, "GENERATED_TRANSFER_ACCOUNT"
+                    )
+            accounts.append(account)
+        return accounts
 
-        account = BankAccount.objects.filter(user=self.user, iban=partner_iban).first()
-        if not account and partner_name == f"{self.user.first_name} {self.user.last_name}":
-            account = BankAccount.objects.create(
-                user=self.user,
-                iban=partner_iban,
-                name="GENERATED_TRANSFER_ACCOUNT",
-            )
-        return account
-    
-    def get_date(self, row):
-        return datetime.strptime(row[self.CSV_FIELDS["booking_date"]], "%Y-%m-%d")
+    def get_prediction_keys(self, columns):
+        return prediction_keys(
+            columns.txn_types,
+            [
+                partner_name or payment_ref
+                for partner_name, payment_ref in zip(
+                    columns["partner_name"], columns["payment_ref"]
+                )
+            ],
+        )
 
-    def get_amount(self, row):
-        return float(row[self.CSV_FIELDS["amount"]])
+    def get_partner_ibans(self, columns):
+        return columns["partner_iban"]
 
-    def get_category(self, row):
+    def get_category(self, row, name=None):
         return super().get_category(
             row=row,
+            name=name,
             model="llama3",
             examples_per_category=self.EXAMPLES_PER_CATEGORY,
             fallback="Altro",
-            categories=self.CATEGORIES
+            categories=self.CATEGORIES,
         )
@@ -0,0 +1,164 @@
+import codecs
+import csv
+import zipfile
+
+
+def detect_encoding(open_chunks, encodings):
+    """
+    Return the first of the candidate encodings able to decode the whole
+    content. `open_chunks` returns a new iterable of its byte chunks, read once
+    for every candidate tried but the last one, which is only checked while
+    the content is decoded.
+    """
+    *candidates, last = encodings
+    for encoding in candidates:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            for chunk in open_chunks():
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return last
+
+
+def iter_lines(open_chunks, encodings):
+    """
+    Incrementally decode the byte chunks returned by `open_chunks` and yield
+    text lines. Only the current chunk and the trailing partial line are kept
+    in memory. The encoding is the first candidate decoding the whole content,
+    so a byte it cannot decode is never replaced: it fails the import with a
+    ValueError instead.
+    """
+    encoding = detect_encoding(open_chunks, encodings)
+    decoder = codecs.getincrementaldecoder(encoding)()
+
+    pending = ""
+    position = 0
+    try:
+        for chunk in open_chunks():
+            *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+            position += len(chunk)
+            for line in lines:
+                yield line + "\n"
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError as error:
+        raise ValueError(
+            f"Unable to decode file with any of: {', '.join(encodings)} "
+            f"(invalid {encoding} byte near position {position + error.start})"
+        ) from error
+    if pending:
+        yield pending
+
+
+def iter_csv_rows(file, encodings, skip_header=True):
+    """
+    Yield the rows of an uploaded CSV file, reading it chunk by chunk.
+    """
+    reader = csv.reader(iter_lines(file.chunks, encodings))
+    if skip_header:
+        next(reader, None)
+    yield from reader
+
+
+def is_archive(file):
+    """
+    Tell whether an uploaded file is a ZIP archive rather than a single CSV.
+    """
+    file.seek(0)
+    archive = zipfile.is_zipfile(file)
+    file.seek(0)
+    return archive
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def archive_members(archive, max_files, max_bytes):
+    """
+    Return the CSV members of an open ZIP archive, in archive order.
+    Raises ValueError if the archive holds more than `max_files` CSV files or
+    more than `max_bytes` once decompressed.
+    """
+    members = [
+        member
+        for member in archive.infolist()
+        if not member.is_dir() and member.filename.lower().endswith(".csv")
+    ]
+    if len(members) > max_files:
+        raise ValueError(f"The archive contains more than {max_files} CSV files")
+    if sum(member.file_size for member in members) > max_bytes:
+        raise ValueError(
+            f"The archive is larger than {max_bytes} bytes once decompressed"
+        )
+    return members
+
+
+class SizeBudget:
+    """
+    Decompressed bytes still allowed for a whole archive, so that members
+    lying about their size cannot exceed the limit either.
+    """
+
+    def __init__(self, max_bytes):
+        self.left = max_bytes
+
+    def spend(self, size):
+        self.left -= size
+        if self.left < 0:
+            raise ValueError("The archive is too large once decompressed")
+
+
+def iter_member_chunks(archive, member, budget):
+    """
+    Yield the decompressed content of an archive member chunk by chunk,
+    charging it to `budget`.
+    """
+    with archive.open(member) as data:
+        for chunk in iter(lambda: data.read(CHUNK_SIZE), b""):
+            budget.spend(len(chunk))
+            yield chunk
+
+
+def iter_archive_rows(archive, members, encodings, max_bytes, skip_header=True):
+    """
+    Yield the rows of the given CSV members of an open ZIP archive, reading
+    one member at a time chunk by chunk, with the header of each one skipped.
+    """
+    budget = SizeBudget(max_bytes)
+    for member in members:
+        # A member may be read more than once to detect its encoding: each read
+        # is bounded by what is left, and the member is charged once
+        def open_chunks(member=member, left=budget.left):
+            return iter_member_chunks(archive, member, SizeBudget(left))
+
+        reader = csv.reader(iter_lines(open_chunks, encodings))
+        if skip_header:
+            next(reader, None)
+        yield from reader
+        budget.spend(member.file_size)
+
+
+def write_archive(target, files, max_files, max_bytes):
+    """
+    Store the given uploaded files in a ZIP archive written to `target`.
+    The CSV files of uploaded archives are copied into it, within the same
+    limits as the import.
+    """
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for index, file in enumerate(files, start=1):
+            if is_archive(file):
+                with zipfile.ZipFile(file) as uploaded:
+                    budget = SizeBudget(max_bytes)
+                    members = archive_members(uploaded, max_files, max_bytes)
+                    for position, member in enumerate(members, start=1):
+                        with archive.open(
+                            f"{index:03d}-{position:03d}.csv", "w"
+                        ) as target_member:
+                            for chunk in iter_member_chunks(uploaded, member, budget):
+                                target_member.write(chunk)
+                continue
+            with archive.open(f"{index:03d}-{file.name}", "w") as member:
+                for chunk in file.chunks():
+                    member.write(chunk)
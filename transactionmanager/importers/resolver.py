@@ -0,0 +1,117 @@
+from ..models import BankAccount, Category
+from ..services.account_summary import invalidate_account_summary
+
+
+class ImportResolver:
+    """
+    In-memory lookup of the user's bank accounts and categories, living for a
+    single import. Everything is loaded once when the import starts, so resolving
+    the accounts and categories of each CSV row issues no query.
+    With `dry_run`, missing accounts and categories are never stored.
+    """
+
+    def __init__(self, user, importer_name, dry_run=False):
+        self.user = user
+        self.importer_name = importer_name
+        self.dry_run = dry_run
+        self.accounts = {
+            account.iban: account for account in BankAccount.objects.filter(user=user)
+        }
+        self.categories = {
+            (category.name, category.txn_type, category.importer): category
+            for category in Category.objects.filter(
+                created_by=user, importer=importer_name
+            )
+        }
+        self.pending_accounts = []
+
+    def ensure_categories(self, categories):
+        """
+        Create with a single query the categories of the importer that the user
+        does not have yet.
+        Categories created meanwhile by a concurrent import are skipped by the
+        unique constraint and loaded instead.
+        """
+        missing = []
+        for name, data in categories.items():
+            txn_type = "IN" if data["is_income"] else "OUT"
+            if (name, txn_type, self.importer_name) not in self.categories:
+                missing.append(
+                    Category(
+                        name=name,
+                        icon=data["icon"],
+                        importer=self.importer_name,
+                        txn_type=txn_type,
+                        created_by=self.user,
+                    )
+                )
+
+        if not missing:
+            return
+
+        if self.dry_run:
+            for category in missing:
+                self.categories[
+                    (category.name, category.txn_type, category.importer)
+                ] = category
+            return
+
+        Category.objects.bulk_create(missing, ignore_conflicts=True)
+        for category in Category.objects.filter(
+            created_by=self.user,
+            importer=self.importer_name,
+            name__in=[category.name for category in missing],
+        ):
+            self.categories[(category.name, category.txn_type, category.importer)] = (
+                category
+            )
+
+    def get_category(self, name, txn_type, icon):
+        """
+        Return the category with the given name and type, creating it if missing.
+        """
+        key = (name, txn_type, self.importer_name)
+        if key not in self.categories and self.dry_run:
+            self.categories[key] = Category(
+                name=name,
+                icon=icon,
+                importer=self.importer_name,
+                txn_type=txn_type,
+                created_by=self.user,
+            )
+        elif key not in self.categories:
+            self.categories[key], _ = Category.objects.get_or_create(
+                name=name,
+                importer=self.importer_name,
+                txn_type=txn_type,
+                created_by=self.user,
+                defaults={"icon": icon},
+            )
+        return self.categories[key]
+
+    def get_account(self, iban):
+        """
+        Return the user's bank account with the given IBAN, if any.
+        """
+        return self.accounts.get(iban)
+
+    def add_account(self, iban, name):
+        """
+        Register a new bank account for the user.
+        The account is stored on the next flush(), together with the others
+        discovered in the same batch.
+        """
+        account = BankAccount(user=self.user, iban=iban, name=name)
+        self.accounts[iban] = account
+        self.pending_accounts.append(account)
+        return account
+
+    def flush(self):
+        """
+        Store with a single query the accounts added since the last flush.
+        """
+        if self.pending_accounts and not self.dry_run:
+            BankAccount.objects.bulk_create(self.pending_accounts)
+            self.pending_accounts = []
+            # bulk_create sends no signal
+            invalidate_account_summary(self.user.pk)
@@ -0,0 +1,93 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from transactionmanager.benchmarks.runner import compare, run_benchmarks
+from transactionmanager.benchmarks.synthetic import MERCHANT_RATIO
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark CSV import, category classification and export on synthetic "
+        "N26 data, in a throwaway test database of the configured engine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            default="1000,100000,1000000",
+            help="Comma separated number of CSV rows to benchmark.",
+        )
+        parser.add_argument(
+            "--output",
+            default="benchmark.json",
+            help="File receiving the JSON results.",
+        )
+        parser.add_argument(
+            "--baseline", help="JSON results of a previous run to compare against."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed slowdown or query increase over the baseline (0.2 = 20%%).",
+        )
+        parser.add_argument(
+            "--ollama-latency",
+            type=float,
+            default=0.0,
+            help="Seconds the Ollama stub waits before answering each call.",
+        )
+        parser.add_argument(
+            "--skip-ollama",
+            action="store_true",
+            help="Do not benchmark the import with category prediction.",
+        )
+        parser.add_argument(
+            "--merchant-ratio",
+            type=float,
+            default=MERCHANT_RATIO,
+            help="Distinct merchants per row of the synthetic files (0.1 = one new merchant every 10 rows).",
+        )
+        parser.add_argument(
+            "--no-memory",
+            action="store_true",
+            help="Do not trace peak memory, which slows down the measured code.",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["rows"].split(",")]
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(
+                sizes,
+                ollama_latency=options["ollama_latency"],
+                with_ollama=not options["skip_ollama"],
+                trace_memory=not options["no_memory"],
+                merchant_ratio=options["merchant_ratio"],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for item in results["results"]:
+            memory = item["peak_memory_bytes"]
+            self.stdout.write(
+                f"{item['name']:>14} {item['rows']:>9} rows  {item['seconds']:>9.3f}s  "
+                f"{item['queries']:>7} queries"
+                + (f"  {memory / 1024 / 1024:>8.1f} MiB" if memory is not None else "")
+            )
+
+        with open(options["output"], "w") as output:
+            json.dump(results, output, indent=2)
+        self.stdout.write(f"Results written to {options['output']}.")
+
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+            lines, regressions = compare(results, baseline, options["tolerance"])
+            for line in lines:
+                self.stdout.write(line)
+            if regressions:
+                raise CommandError(f"Performance regressions: {', '.join(regressions)}")
@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from transactionmanager.models import BankAccount
+from transactionmanager.services.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the monthly rollups from the stored transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", help="Username whose rollups are rebuilt (default: every user)."
+        )
+
+    def handle(self, *args, **options):
+        accounts = BankAccount.objects.all()
+        if options["user"]:
+            User = get_user_model()
+            try:
+                user = User.objects.get(**{User.USERNAME_FIELD: options["user"]})
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist.")
+            accounts = accounts.filter(user=user)
+
+        written = rebuild_rollups(accounts)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} monthly rollups."))
@@ -0,0 +1,86 @@
+import os
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from transactionmanager.services.jobs import claim_next_job, requeue_stale_jobs, run_job
+from transactionmanager.services.metrics import registry, scrape_allowed
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serve the metrics of the worker process in the Prometheus text format to
+    clients sending the METRICS_TOKEN bearer token.
+    """
+
+    def do_GET(self):
+        if not scrape_allowed(
+            self.headers.get("Authorization"), settings.METRICS_TOKEN
+        ):
+            self.send_response(401)
+            self.send_header("WWW-Authenticate", 'Bearer realm="metrics"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Process queued CSV import jobs. Several workers can run in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait before polling again when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit as soon as the queue is empty.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Serve the worker's metrics in the Prometheus text format on this port.",
+        )
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Import worker {worker} started.")
+
+        if options["metrics_port"] and not settings.METRICS_TOKEN:
+            self.stderr.write(
+                "METRICS_TOKEN is not set: the worker's metrics are not served."
+            )
+        elif options["metrics_port"]:
+            server = ThreadingHTTPServer(("", options["metrics_port"]), MetricsHandler)
+            Thread(target=server.serve_forever, daemon=True).start()
+            self.stdout.write(f"Serving metrics on port {options['metrics_port']}.")
+
+        while True:
+            requeue_stale_jobs()
+            job = claim_next_job(worker)
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.stdout.write(f"Running import job {job.pk}...")
+            run_job(job)
+            job.refresh_from_db()
+            self.stdout.write(f"Import job {job.pk}: {job.status}.")
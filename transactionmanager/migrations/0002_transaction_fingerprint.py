@@ -0,0 +1,80 @@
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def transaction_fingerprint(date, amount, txn_type, description, partner_iban=""):
+    """
+    Copy of utils.fingerprint.transaction_fingerprint as of this migration, so
+    the backfill does not change when the application code does.
+    """
+    amount = abs(Decimal(str(amount))).quantize(Decimal("0.01"))
+    description = " ".join((description or "").split()).upper()
+    partner_iban = "".join((partner_iban or "").split()).upper()
+
+    payload = "|".join(
+        [date.strftime("%Y-%m-%d"), str(amount), txn_type, description, partner_iban]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """
+    Compute the fingerprint of every stored transaction and delete the rows that
+    duplicate an older transaction of the same bank account.
+    The partner IBAN is not stored, so the transfer account IBAN is used instead.
+    """
+    Transaction = apps.get_model("transactionmanager", "Transaction")
+
+    seen = set()
+    duplicates = []
+    pending = []
+
+    rows = (
+        Transaction.objects.select_related("transfer_account")
+        .order_by("bank_account_id", "id")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    for txn in rows:
+        txn.fingerprint = transaction_fingerprint(
+            txn.date,
+            txn.amount,
+            txn.txn_type,
+            txn.description,
+            txn.transfer_account.iban if txn.transfer_account else "",
+        )
+        key = (txn.bank_account_id, txn.fingerprint)
+        if key in seen:
+            duplicates.append(txn.id)
+            continue
+        seen.add(key)
+        pending.append(txn)
+
+        if len(pending) >= BATCH_SIZE:
+            Transaction.objects.bulk_update(pending, ["fingerprint"])
+            pending = []
+
+    if pending:
+        Transaction.objects.bulk_update(pending, ["fingerprint"])
+
+    for start in range(0, len(duplicates), BATCH_SIZE):
+        Transaction.objects.filter(id__in=duplicates[start:start + BATCH_SIZE]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
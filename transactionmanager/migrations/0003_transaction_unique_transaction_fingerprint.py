@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0002_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('bank_account', 'fingerprint'), name='unique_transaction_fingerprint'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0003_transaction_unique_transaction_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/')),
+                ('status', models.CharField(choices=[('queued', 'In coda'), ('running', 'In corso'), ('done', 'Completata'), ('failed', 'Fallita')], default='queued', max_length=16)),
+                ('rows_parsed', models.PositiveIntegerField(default=0)),
+                ('rows_classified', models.PositiveIntegerField(default=0)),
+                ('rows_written', models.PositiveIntegerField(default=0)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=128)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('bank_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='transactionmanager.bankaccount')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='transaction_status_77d61d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_categories(apps, schema_editor):
+    """
+    Keep the oldest category of each (user, importer, name, type) group, move the
+    transactions of the duplicates to it and delete the duplicates, so the
+    unique constraint of the next migration can be added.
+    """
+    Category = apps.get_model("transactionmanager", "Category")
+    Transaction = apps.get_model("transactionmanager", "Transaction")
+
+    groups = (
+        Category.objects.values("created_by", "importer", "name", "txn_type")
+        .annotate(keep=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    for group in groups:
+        duplicates = list(
+            Category.objects.filter(
+                created_by=group["created_by"],
+                importer=group["importer"],
+                name=group["name"],
+                txn_type=group["txn_type"],
+            )
+            .exclude(id=group["keep"])
+            .values_list("id", flat=True)
+        )
+        Transaction.objects.filter(category_id__in=duplicates).update(
+            category_id=group["keep"]
+        )
+        Category.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0008_dataversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0009_merge_duplicate_categories'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['bank_account', 'date', 'id'], name='transaction_bank_ac_d45102_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(fields=('created_by', 'importer', 'name', 'txn_type'), name='unique_category'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0010_category_unique_transaction_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('import', 'Importazione'), ('preview', 'Anteprima'), ('commit', 'Conferma anteprima')], default='import', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'In coda'), ('running', 'In corso'), ('previewed', 'Anteprima pronta'), ('done', 'Completata'), ('failed', 'Fallita')], default='queued', max_length=16),
+        ),
+    ]
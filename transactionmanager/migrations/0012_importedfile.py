@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0011_importjob_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64)),
+                ('rows', models.PositiveIntegerField()),
+                ('checkpoints', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bank_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imported_files', to='transactionmanager.bankaccount')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bank_account', 'digest'), name='unique_imported_file')],
+            },
+        ),
+    ]
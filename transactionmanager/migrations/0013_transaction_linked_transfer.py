@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0012_importedfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='linked_transfer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mirrors', to='transactionmanager.transaction'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0013_transaction_linked_transfer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['bank_account', 'category', 'date', 'id'], name='transaction_bank_ac_241612_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['bank_account', 'txn_type', 'date', 'id'], name='transaction_bank_ac_cbb2ce_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0014_transaction_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('expense', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transfers_in', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transfers_out', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('bank_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='transactionmanager.bankaccount')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='transactionmanager.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('bank_account', 'category', 'month'), name='unique_monthly_rollup'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('bank_account', 'month'), name='unique_uncategorized_monthly_rollup')],
+            },
+        ),
+    ]
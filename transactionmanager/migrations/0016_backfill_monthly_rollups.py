@@ -0,0 +1,63 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+COLUMNS = ("income", "expense", "transfers_in", "transfers_out")
+
+
+def rollup_column(txn_type, linked):
+    if txn_type == "TRSF":
+        return "transfers_out"
+    if linked:
+        return "transfers_in"
+    return "income" if txn_type == "IN" else "expense"
+
+
+def backfill_monthly_rollups(apps, schema_editor):
+    """
+    Compute the monthly rollups of the transactions stored before they existed,
+    grouped the same way as services.rollups.rollup_cells as of this migration.
+    """
+    Transaction = apps.get_model("transactionmanager", "Transaction")
+    MonthlyRollup = apps.get_model("transactionmanager", "MonthlyRollup")
+
+    cells = defaultdict(lambda: {**dict.fromkeys(COLUMNS, Decimal(0)), "count": 0})
+    rows = (
+        Transaction.objects.annotate(
+            month=TruncMonth("date"),
+            linked=ExpressionWrapper(
+                Q(linked_transfer__isnull=False), output_field=BooleanField()
+            ),
+        )
+        .values("bank_account_id", "category_id", "month", "txn_type", "linked")
+        .annotate(total=Sum("amount"), transactions=Count("id"))
+        .order_by()
+    )
+    for row in rows:
+        month = timezone.localtime(row["month"]).date().replace(day=1)
+        cell = cells[(row["bank_account_id"], row["category_id"], month)]
+        cell[rollup_column(row["txn_type"], row["linked"])] += row["total"]
+        cell["count"] += row["transactions"]
+
+    MonthlyRollup.objects.bulk_create(
+        [
+            MonthlyRollup(bank_account_id=account, category_id=category, month=month, **cell)
+            for (account, category, month), cell in cells.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactionmanager", "0015_monthlyrollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_monthly_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactionmanager', '0017_importjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.RenameIndex(
+            model_name='transaction',
+            new_name='txn_account_date_idx',
+            old_name='transaction_bank_ac_d45102_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='transaction',
+            new_name='txn_account_category_date_idx',
+            old_name='transaction_bank_ac_241612_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='transaction',
+            new_name='txn_account_type_date_idx',
+            old_name='transaction_bank_ac_cbb2ce_idx',
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -16,13 +17,17 @@ class BankAccount(models.Model):
     bank_type = models.CharField(
         max_length=32, choices=BANK_CHOICES, blank=True, default=""
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.name} ({self.iban})"
 
     def save(self, *args, **kwargs):
         if self.main_account:
-            BankAccount.objects.filter(user=self.user).update(main_account=False)
+            BankAccount.objects.filter(user=self.user, main_account=True).update(
+                main_account=False, updated_at=timezone.now()
+            )
         super().save(*args, **kwargs)
 
 
@@ -36,13 +41,27 @@ class Category(models.Model):
     created_by = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="categories"
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Also serves the per-user lookups of the importers
+            models.UniqueConstraint(
+                fields=["created_by", "importer", "name", "txn_type"],
+                name="unique_category",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.txn_type}) - {self.importer}"
 
     @classmethod
-    def input_categories(cls):
-        return cls.objects.filter(txn_type="IN")
+    def input_categories(cls, user=None):
+        categories = cls.objects.filter(txn_type="IN")
+        if user is not None:
+            categories = categories.filter(created_by=user)
+        return categories
 
 
 class Transaction(models.Model):
@@ -64,6 +83,254 @@ class Transaction(models.Model):
         choices=[("IN", "Entrata"), ("OUT", "Uscita"), ("TRSF", "Trasferimento")],
     )
     description = models.TextField(blank=True)
+    # NULL rather than "" so rows saved before fingerprints existed do not
+    # collide in the unique (bank_account, fingerprint) constraint
+    fingerprint = models.CharField(max_length=64, null=True, blank=True, editable=False)  # noqa: DJ001
+    # Set on the incoming leg of an internal transfer: the outgoing TRSF leg
+    # already represents it, so this row is kept only for import dedupe
+    linked_transfer = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        related_name="mirrors",
+        on_delete=models.SET_NULL,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bank_account", "fingerprint"],
+                name="unique_transaction_fingerprint",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["bank_account", "updated_at"]),
+            # Listings and exports of an account, by date then id as a tie-breaker
+            models.Index(
+                fields=["bank_account", "date", "id"], name="txn_account_date_idx"
+            ),
+            # Listings of an account filtered by category or type
+            models.Index(
+                fields=["bank_account", "category", "date", "id"],
+                name="txn_account_category_date_idx",
+            ),
+            models.Index(
+                fields=["bank_account", "txn_type", "date", "id"],
+                name="txn_account_type_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.date.strftime('%Y-%m-%d')} - {self.bank_account.name} - {self.amount} {self.txn_type} - {self.description}"
+
+
+class ImportJob(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    PREVIEWED = "previewed"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "In coda"),
+        (RUNNING, "In corso"),
+        (PREVIEWED, "Anteprima pronta"),
+        (DONE, "Completata"),
+        (FAILED, "Fallita"),
+    ]
+    # An import writes the file directly; a preview only parses and classifies
+    # it, and is then committed from the cached rows once confirmed
+    IMPORT = "import"
+    PREVIEW = "preview"
+    COMMIT = "commit"
+    MODE_CHOICES = [
+        (IMPORT, "Importazione"),
+        (PREVIEW, "Anteprima"),
+        (COMMIT, "Conferma anteprima"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="import_jobs")
+    bank_account = models.ForeignKey(BankAccount, on_delete=models.CASCADE)
+    file = models.FileField(upload_to="imports/")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    mode = models.CharField(max_length=16, choices=MODE_CHOICES, default=IMPORT)
+    rows_parsed = models.PositiveIntegerField(default=0)
+    rows_classified = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=128, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Last time the worker running the job reported progress
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Import #{self.pk} - {self.bank_account.name} ({self.status})"
+
+    def progress(self):
+        """
+        Return the job status and row counters as a JSON-serializable dict.
+        """
+        return {
+            "id": self.pk,
+            "status": self.status,
+            "mode": self.mode,
+            "rows_parsed": self.rows_parsed,
+            "rows_classified": self.rows_classified,
+            "rows_written": self.rows_written,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class CategoryPrediction(models.Model):
+    """
+    Category predicted for a merchant, reused by later imports of the same user.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="category_predictions"
+    )
+    importer = models.CharField(max_length=32)
+    key = models.CharField(max_length=255)
+    category_name = models.CharField(max_length=128)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "importer", "key"],
+                name="unique_category_prediction",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.key} -> {self.category_name} ({self.importer})"
+
+
+class CategorizerModel(models.Model):
+    """
+    Word counts of the local category classifier of a user, one per importer.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="categorizer_models"
+    )
+    importer = models.CharField(max_length=32)
+    data = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "importer"],
+                name="unique_categorizer_model",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Categorizer of {self.user} ({self.importer})"
+
+
+class ExportCursor(models.Model):
+    """
+    When the user last exported, so the next export can include only changes.
+    """
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name="export_cursor"
+    )
+    exported_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user} exported at {self.exported_at}"
+
+
+class DataVersion(models.Model):
+    """
+    Counter bumped whenever the transactions, accounts or categories of a user
+    change, used to key and validate cached exports.
+    """
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name="data_version"
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user} v{self.version}"
+
+
+class ImportedFile(models.Model):
+    """
+    Digest of a file imported on a bank account, with the digest of its leading
+    rows at every batch boundary, so that uploading it again, or a file starting
+    with the same rows, skips the batches already imported.
+    """
+
+    bank_account = models.ForeignKey(
+        BankAccount, on_delete=models.CASCADE, related_name="imported_files"
+    )
+    digest = models.CharField(max_length=64)
+    rows = models.PositiveIntegerField()
+    # Number of leading rows -> digest of those rows
+    checkpoints = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bank_account", "digest"], name="unique_imported_file"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bank_account.name} - {self.rows} rows ({self.digest[:12]})"
+
+
+class MonthlyRollup(models.Model):
+    """
+    Totals of the transactions of an account in a category and month, kept up
+    to date by imports and by the changes to single transactions.
+    Incoming legs linked to an internal transfer count as transfers, not income.
+    """
+
+    bank_account = models.ForeignKey(
+        BankAccount, on_delete=models.CASCADE, related_name="monthly_rollups"
+    )
+    category = models.ForeignKey(
+        Category, null=True, blank=True, on_delete=models.CASCADE
+    )
+    # First day of the month, in the local time zone
+    month = models.DateField()
+    income = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    expense = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transfers_in = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transfers_out = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bank_account", "category", "month"],
+                condition=models.Q(category__isnull=False),
+                name="unique_monthly_rollup",
+            ),
+            models.UniqueConstraint(
+                fields=["bank_account", "month"],
+                condition=models.Q(category__isnull=True),
+                name="unique_uncategorized_monthly_rollup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bank_account.name} - {self.month:%Y-%m} - {self.category or '-'}"
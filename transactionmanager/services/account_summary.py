@@ -0,0 +1,55 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ..models import BANK_CHOICES, BankAccount
+
+AccountSummary = namedtuple(
+    "AccountSummary", ["count", "main_account_id", "bank_types"]
+)
+
+
+def account_summary_cache_key(user_id):
+    return f"account-summary:{user_id}"
+
+
+def build_account_summary(user_id):
+    """
+    Summarize the bank accounts of a user with a single query: how many they
+    are, the id of the main one and the supported bank types among them.
+    """
+    supported = {choice[0] for choice in BANK_CHOICES}
+    count = 0
+    main_account_id = None
+    bank_types = set()
+    for pk, main_account, bank_type in BankAccount.objects.filter(
+        user_id=user_id
+    ).values_list("id", "main_account", "bank_type"):
+        count += 1
+        if main_account:
+            main_account_id = pk
+        if bank_type in supported:
+            bank_types.add(bank_type)
+    return AccountSummary(count, main_account_id, tuple(sorted(bank_types)))
+
+
+def get_account_summary(request):
+    """
+    Return the AccountSummary of the user of a request.
+    It is computed at most once per request and kept in the default cache
+    until the user's accounts change.
+    """
+    summary = getattr(request, "_account_summary", None)
+    if summary is None:
+        key = account_summary_cache_key(request.user.pk)
+        summary = cache.get(key)
+        if summary is None:
+            summary = build_account_summary(request.user.pk)
+            cache.set(key, summary, settings.ACCOUNT_SUMMARY_TIMEOUT)
+        request._account_summary = summary
+    return summary
+
+
+def invalidate_account_summary(user_id):
+    cache.delete(account_summary_cache_key(user_id))
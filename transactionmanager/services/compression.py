@@ -0,0 +1,122 @@
+import logging
+import time
+import zipfile
+import zlib
+
+from .metrics import log_event
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    "gzip": "application/gzip",
+    "zip": "application/zip",
+}
+EXTENSIONS = {
+    "gzip": "csv.gz",
+    "zip": "zip",
+}
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Tell whether an Accept-Encoding header allows a gzip response, honouring
+    the q-values: `gzip;q=0` refuses it, `*` accepts it unless gzip is listed.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    if "gzip" in qualities:
+        return qualities["gzip"] > 0
+    return qualities.get("*", 0) > 0
+
+
+class ChunkWriter:
+    """
+    Write-only, unseekable file collecting what is written into it until the
+    chunks are taken, so a ZipFile can be streamed.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def compress_lines(lines, method, filename="export.csv"):
+    """
+    Yield the compressed chunks of the lines of an export as they are produced,
+    so neither the export nor its compressed form is held in memory.
+    `method` is "gzip" or "zip"; zip archives contain a single `filename` entry.
+    The compression ratio and time are logged once the export is complete.
+    """
+    if method not in CONTENT_TYPES:
+        raise ValueError(f"Unsupported compression: {method}")
+
+    start = time.perf_counter()
+    original_size = 0
+    compressed_size = 0
+
+    if method == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, wbits=31)
+        for line in lines:
+            data = line.encode("utf-8")
+            original_size += len(data)
+            chunk = compressor.compress(data)
+            if chunk:
+                compressed_size += len(chunk)
+                yield chunk
+        chunk = compressor.flush()
+        compressed_size += len(chunk)
+        yield chunk
+    else:
+        output = ChunkWriter()
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(filename, "w", force_zip64=True) as entry:
+                for line in lines:
+                    data = line.encode("utf-8")
+                    original_size += len(data)
+                    entry.write(data)
+                    chunk = output.take()
+                    if chunk:
+                        compressed_size += len(chunk)
+                        yield chunk
+        chunk = output.take()
+        compressed_size += len(chunk)
+        yield chunk
+
+    log_event(
+        logger,
+        "export_compressed",
+        method=method,
+        original_size=original_size,
+        compressed_size=compressed_size,
+        ratio=round(original_size / compressed_size, 2) if compressed_size else None,
+        seconds=round(time.perf_counter() - start, 4),
+    )
@@ -0,0 +1,38 @@
+from functools import lru_cache
+
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import BankAccount, DataVersion
+
+
+def bump_data_version(user_id):
+    """
+    Record that the data of a user changed, invalidating their cached exports.
+    """
+    updated = DataVersion.objects.filter(user_id=user_id).update(
+        version=F("version") + 1, changed_at=timezone.now()
+    )
+    if not updated:
+        DataVersion.objects.get_or_create(user_id=user_id, defaults={"version": 1})
+
+
+def get_data_version(user):
+    """
+    Return the DataVersion of a user, creating it the first time.
+    """
+    version, _ = DataVersion.objects.get_or_create(user=user)
+    return version
+
+
+@lru_cache(maxsize=4096)
+def account_owner(account_id):
+    """
+    Return the id of the user owning a bank account. Accounts never change owner,
+    so the answer is memoized.
+    """
+    return (
+        BankAccount.objects.filter(pk=account_id)
+        .values_list("user_id", flat=True)
+        .first()
+    )
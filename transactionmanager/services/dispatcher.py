@@ -5,9 +5,20 @@ PARSERS = {
 }
 
 
-def dispatch_import(user, file, bank_format, iban=None):
+def dispatch_import(
+    user,
+    file,
+    bank_format,
+    iban=None,
+    batch_size=None,
+    progress=None,
+    dry_run=False,
+    previewed=None,
+):
     """
     Dispatches the correct importer based on bank_format.
+    With `dry_run` the file is only previewed; `previewed` writes the rows of a
+    previous dry run instead of reading a file.
     """
     bank_format = bank_format.lower()
 
@@ -15,4 +26,12 @@ def dispatch_import(user, file, bank_format, iban=None):
     if not importer:
         raise ValueError(f"Unsupported bank format: {bank_format}")
 
-    return importer(user=user, file=file, iban=iban).import_transactions()
+    return importer(
+        user=user,
+        file=file,
+        iban=iban,
+        batch_size=batch_size,
+        progress=progress,
+        dry_run=dry_run,
+        previewed=previewed,
+    ).import_transactions()
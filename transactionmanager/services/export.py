@@ -1,8 +1,67 @@
 import csv
-import io
+import logging
 from datetime import datetime
 
-from ..models import BankAccount
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from ..models import BankAccount, ExportCursor
+from .metrics import OPERATIONS, ROWS, StageTimer, log_event
+
+logger = logging.getLogger(__name__)
+
+
+def export_cache_key(user, version):
+    """
+    Key of the full export of a user at a given data version.
+    """
+    return f"export:{user.pk}:{version}"
+
+
+def stream_and_cache(lines, key, max_bytes=None):
+    """
+    Yield the lines of an export while keeping a copy, stored in the "exports"
+    cache under `key` once the export is complete. Exports larger than
+    `max_bytes` are streamed but not cached.
+    """
+    max_bytes = max_bytes or settings.EXPORT_CACHE_MAX_BYTES
+    parts = []
+    size = 0
+
+    for line in lines:
+        if parts is not None:
+            size += len(line)
+            if size > max_bytes:
+                parts = None
+            else:
+                parts.append(line)
+        yield line
+
+    if parts is not None:
+        caches["exports"].set(key, "".join(parts))
+
+
+def advance_cursor_when_sent(chunks, user, exported_at):
+    """
+    Yield the chunks of an export, then move the export cursor of `user` to
+    `exported_at`. The cursor only moves once the server asked for more than
+    the last chunk, so an interrupted download sends the same changes again.
+    """
+    yield from chunks
+    ExportCursor.objects.update_or_create(
+        user=user, defaults={"exported_at": exported_at}
+    )
+
+
+class Echo:
+    """
+    File-like object whose write() returns the value instead of buffering it,
+    so csv.writer can be used to produce one line at a time.
+    """
+
+    def write(self, value):
+        return value
 
 
 class Exporter:
@@ -22,11 +81,26 @@ class Exporter:
         "amountLimit,code,mainCurrency"
     )
 
-    def __init__(self, transactions, user, categories=None, in_categories=None):
+    def __init__(
+        self,
+        transactions,
+        user,
+        categories=None,
+        in_categories=None,
+        chunk_size=None,
+        since=None,
+    ):
         self.transactions = transactions
         self.user = user
         self.categories = categories or []
-        self.in_categories = in_categories or []
+        # Names of the income categories, evaluated once instead of per category
+        self.in_categories = {
+            getattr(category, "name", category) for category in in_categories or []
+        }
+        self.chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+        # When set, only the rows created or changed after this moment are exported
+        self.since = since
+        self.stats = None
 
     def now(self):
         """
@@ -37,69 +111,190 @@ class Exporter:
     def render_transactions_to_csv(self):
         """
         Renders transactions and bank accounts to a CSV format compatible with SOSSOLDI.
+        With `since`, only what was created or changed after it is rendered.
         """
-        buffer = io.StringIO()
-        writer = csv.writer(buffer)
-        writer.writerow(self.SOSSOLDI_HEADER.split(","))
+        return "".join(self.iter_csv())
 
-        # 1. Bank accounts
-        for account in BankAccount.objects.filter(user=self.user):
-            writer.writerow(
-                [
-                    "bankAccount",
-                    account.id,
-                    account.name,
-                    "payments",
-                    account.id,
-                    0.0,
-                    1,
-                    1 if account.main_account else 0,
-                    self.now(),
-                    self.now(),
-                    "",
-                    "1",
-                    "",
-                    "",
-                    "",
-                    "",
-                    "",
-                    "",
-                    "",
-                    "",
-                    "",
-                    "",
-                    "",
-                    "",
-                    "",
+    def iter_csv(self):
+        """
+        Yields the CSV export line by line, so it can be streamed to the client
+        without building the whole file in memory.
+        Once the export is complete, its stages are logged and added to the
+        process metrics.
+        """
+        writer = csv.writer(Echo())
+        self.stats = StageTimer("export")
+        with connection.execute_wrapper(self.stats):
+            for row in self.iter_rows():
+                yield writer.writerow(row)
+        self.publish_metrics()
+
+    def publish_metrics(self):
+        """
+        Add the export to the process metrics and log a structured summary line.
+        """
+        self.stats.publish()
+        OPERATIONS.inc(operation="export", bank="")
+        rows = {
+            section: self.stats.items[section]
+            for section in ("accounts", "transactions", "categories")
+        }
+        for section, count in rows.items():
+            ROWS.inc(count, operation="export", bank="", outcome=section)
+
+        seconds = self.stats.total_seconds
+        log_event(
+            logger,
+            "export_finished",
+            user=self.user.pk,
+            delta=self.since is not None,
+            seconds=round(seconds, 4),
+            rows_per_second=round(sum(rows.values()) / seconds, 1) if seconds else None,
+            queries=sum(self.stats.queries.values()),
+            **rows,
+        )
+
+    def iter_transactions(self):
+        """
+        Iterates over the transactions, fetching querysets in chunks.
+        """
+        transactions = self.transactions
+        if hasattr(transactions, "iterator"):
+            if self.since:
+                transactions = transactions.filter(updated_at__gt=self.since)
+            return transactions.iterator(chunk_size=self.chunk_size)
+        if self.since:
+            return (tx for tx in transactions if tx.updated_at > self.since)
+        return iter(transactions)
+
+    def iter_rows(self):
+        """
+        Yields the rows of the export: header, bank accounts, transactions and
+        categories.
+        """
+        yield self.SOSSOLDI_HEADER.split(",")
+
+        # The same timestamp is used for every account and category of an export
+        now = self.now()
+
+        yield from self.timed("accounts", self.iter_account_rows(now))
+        yield from self.timed("transactions", self.iter_transaction_rows())
+        yield from self.timed("categories", self.iter_category_rows(now))
+
+    def timed(self, stage, rows):
+        """
+        Time the production of the rows of a section when the export is measured.
+        """
+        if self.stats is None:
+            return rows
+        return self.stats.timed(stage, rows)
+
+    def iter_account_rows(self, now):
+        """
+        Yields a row per bank account of the user.
+        """
+        accounts = BankAccount.objects.filter(user=self.user)
+        if self.since:
+            accounts = accounts.filter(updated_at__gt=self.since)
+        for account in accounts:
+            yield [
+                "bankAccount",
+                account.id,
+                account.name,
+                "payments",
+                account.id,
+                0.0,
+                1,
+                1 if account.main_account else 0,
+                now,
+                now,
+                "",
+                "1",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+            ]
+
+    def iter_transaction_rows(self):
+        """
+        Yields a row per transaction.
+        """
+        for tx in self.iter_transactions():
+            date = tx.date.strftime("%Y-%m-%d %H:%M:%S.%f")
+            yield [
+                "transaction",
+                tx.id,
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                date,
+                date,
+                "",
+                date,
+                abs(tx.amount),
+                tx.txn_type,
+                tx.description or "",
+                tx.category_id or "",
+                tx.bank_account_id,
+                tx.transfer_account_id or "",
+                0,
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+            ]
+
+    def iter_category_rows(self, now):
+        """
+        Yields a row per category, when categories are exported.
+        """
+        if self.categories:
+            base_id = 10
+            for idx, cat in enumerate(self.categories):
+                # Ids are positional, so unchanged categories still take their slot
+                if self.since and cat.updated_at <= self.since:
+                    continue
+                txn_type = "IN" if cat.name in self.in_categories else "OUT"
+                yield [
+                    "categoryTransaction",
+                    base_id + idx,
+                    cat.name,
+                    cat.icon,
+                    idx,
                     "",
                     "",
                     "",
-                ]
-            )
-
-        # 2. Transactions
-        for tx in self.transactions:
-            writer.writerow(
-                [
-                    "transaction",
-                    tx.id,
+                    now,
+                    now,
                     "",
                     "",
                     "",
+                    txn_type,
                     "",
                     "",
                     "",
-                    tx.date.strftime("%Y-%m-%d %H:%M:%S.%f"),
-                    tx.date.strftime("%Y-%m-%d %H:%M:%S.%f"),
                     "",
-                    tx.date.strftime("%Y-%m-%d %H:%M:%S.%f"),
-                    abs(tx.amount),
-                    tx.txn_type,
-                    tx.description or "",
-                    tx.category.id if tx.category else "",
-                    tx.bank_account.id,
-                    tx.transfer_account.id if tx.transfer_account else "",
-                    0,
                     "",
                     "",
                     "",
@@ -110,43 +305,3 @@ class Exporter:
                     "",
                     "",
                 ]
-            )
-
-        # 3. Optional categories
-        if self.categories:
-            base_id = 10
-            for idx, cat in enumerate(self.categories):
-                txn_type = "IN" if cat.name in self.in_categories else "OUT"
-                writer.writerow(
-                    [
-                        "categoryTransaction",
-                        base_id + idx,
-                        cat.name,
-                        cat.icon,
-                        idx,
-                        "",
-                        "",
-                        "",
-                        self.now(),
-                        self.now(),
-                        "",
-                        "",
-                        "",
-                        txn_type,
-                        "",
-                        "",
-                        "",
-                        "",
-                        "",
-                        "",
-                        "",
-                        "",
-                        "",
-                        "",
-                        "",
-                        "",
-                        "",
-                    ]
-                )
-
-        return buffer.getvalue()
@@ -0,0 +1,216 @@
+import logging
+from datetime import timedelta
+from threading import Event, Thread
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from ..models import ImportJob
+from .dispatcher import dispatch_import
+from .metrics import log_event
+
+logger = logging.getLogger(__name__)
+
+
+def claim_next_job(worker):
+    """
+    Atomically take the oldest queued import job for the given worker.
+    The status is switched with a conditional UPDATE, so when several workers
+    race for the same job only one of them gets it. Returns None if the queue
+    is empty.
+    """
+    candidates = (
+        ImportJob.objects.filter(status=ImportJob.QUEUED)
+        .order_by("created_at")
+        .values_list("pk", flat=True)[:10]
+    )
+    for pk in candidates:
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(pk=pk, status=ImportJob.QUEUED).update(
+            status=ImportJob.RUNNING, worker=worker, started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return ImportJob.objects.select_related("user", "bank_account").get(pk=pk)
+    return None
+
+
+def requeue_stale_jobs():
+    """
+    Queue again the running jobs whose worker stopped sending heartbeats for
+    IMPORT_JOB_STALE_SECONDS, such as the ones left behind by a crashed worker.
+    Rows already written by the interrupted run are skipped as duplicates.
+    Returns the number of requeued jobs.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    requeued = ImportJob.objects.filter(
+        status=ImportJob.RUNNING, heartbeat_at__lt=stale
+    ).update(
+        status=ImportJob.QUEUED,
+        worker="",
+        rows_parsed=0,
+        rows_classified=0,
+        rows_written=0,
+        started_at=None,
+        heartbeat_at=None,
+    )
+    if requeued:
+        log_event(logger, "import_jobs_requeued", logging.WARNING, jobs=requeued)
+    return requeued
+
+
+def preview_cache_key(job_pk):
+    """
+    Key of the parsed and classified rows of a previewed import job.
+    """
+    return f"import-preview:{job_pk}"
+
+
+class ClaimLost(Exception):
+    """
+    Raised when a running job was queued again and claimed by another worker.
+    """
+
+
+def claimed(job):
+    """
+    Queryset of the job while it is still running on the worker that claimed it.
+    """
+    return ImportJob.objects.filter(
+        pk=job.pk, status=ImportJob.RUNNING, worker=job.worker
+    )
+
+
+class Heartbeat:
+    """
+    Refresh the heartbeat of a running job every `interval` seconds from a
+    background thread, so a job busy on a slow batch (e.g. waiting on Ollama)
+    is not taken for orphaned. `lost` is set once the job is no longer claimed
+    by its worker.
+    """
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or settings.IMPORT_JOB_HEARTBEAT_SECONDS
+        self.lost = False
+        self.stopped = Event()
+        self.thread = Thread(target=self.run, name=f"heartbeat-{job.pk}", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if not claimed(self.job).update(heartbeat_at=timezone.now()):
+                        self.lost = True
+                        return
+                except DatabaseError:
+                    # The next beat will try again, well before the job looks stale
+                    logger.warning(
+                        "Heartbeat of import job %s failed", self.job.pk, exc_info=True
+                    )
+        finally:
+            connection.close()
+
+
+def run_job(job):
+    """
+    Run a claimed import job, storing its progress and final result.
+    A preview job keeps its parsed and classified rows in the "imports" cache,
+    where the job confirming it reads them instead of the file.
+    Every update is conditional on the job still being claimed by this worker:
+    if it was queued again and taken over by another worker, this run stops
+    at its next progress report and leaves the job to the other one.
+    """
+    heartbeat = Heartbeat(job)
+
+    def progress(parsed, classified, written):
+        updated = not heartbeat.lost and claimed(job).update(
+            rows_parsed=parsed,
+            rows_classified=classified,
+            rows_written=written,
+            heartbeat_at=timezone.now(),
+        )
+        if not updated:
+            raise ClaimLost(f"Import job {job.pk} is no longer claimed by {job.worker}")
+
+    options = {
+        "user": job.user,
+        "bank_format": job.bank_account.bank_type,
+        "iban": job.bank_account.iban,
+        "progress": progress,
+    }
+    try:
+        with heartbeat:
+            if job.mode == ImportJob.COMMIT:
+                previewed = caches["imports"].get(preview_cache_key(job.pk))
+                if previewed is None:
+                    raise ValueError("Anteprima scaduta: carica di nuovo il file.")
+                result = dispatch_import(file=None, previewed=previewed, **options)
+            else:
+                with job.file.open("rb") as file:
+                    result = dispatch_import(
+                        file=file, dry_run=job.mode == ImportJob.PREVIEW, **options
+                    )
+    except ClaimLost:
+        log_event(
+            logger, "import_job_lost", logging.WARNING, job=job.pk, worker=job.worker
+        )
+        return
+    except Exception as e:
+        logger.exception("Import job %s failed", job.pk)
+        claimed(job).update(
+            status=ImportJob.FAILED, error=str(e), finished_at=timezone.now()
+        )
+        return
+
+    status = ImportJob.DONE
+    if job.mode == ImportJob.PREVIEW:
+        caches["imports"].set(preview_cache_key(job.pk), result.pop("preview_rows"))
+        status = ImportJob.PREVIEWED
+
+    result.pop("categories", None)
+    if not claimed(job).update(
+        status=status, result=result, finished_at=timezone.now()
+    ):
+        # The worker now running the job still needs its file and preview
+        log_event(
+            logger, "import_job_lost", logging.WARNING, job=job.pk, worker=job.worker
+        )
+        return
+    if job.mode == ImportJob.COMMIT:
+        caches["imports"].delete(preview_cache_key(job.pk))
+    if job.file:
+        job.file.delete(save=False)
+
+
+def confirm_job(job):
+    """
+    Queue again a previewed job to write its cached rows.
+    Returns False if the job is not waiting for confirmation or its preview
+    expired from the cache.
+    """
+    if (
+        job.status != ImportJob.PREVIEWED
+        or preview_cache_key(job.pk) not in caches["imports"]
+    ):
+        return False
+    return bool(
+        ImportJob.objects.filter(pk=job.pk, status=ImportJob.PREVIEWED).update(
+            status=ImportJob.QUEUED,
+            mode=ImportJob.COMMIT,
+            rows_parsed=0,
+            rows_classified=0,
+            rows_written=0,
+            started_at=None,
+            finished_at=None,
+        )
+    )
@@ -0,0 +1,169 @@
+import math
+from collections import Counter
+
+from django.conf import settings
+
+from ..models import CategorizerModel, Transaction
+from .prediction_cache import normalize_merchant
+
+
+def tokenize(description, txn_type):
+    """
+    Split a description into the features used by the classifier: the
+    transaction type, the normalized words and the pairs of adjacent words.
+    """
+    words = normalize_merchant(description).split()
+    return [f"__{txn_type}__", *words, *(f"{a}_{b}" for a, b in zip(words, words[1:]))]
+
+
+class NaiveBayesClassifier:
+    """
+    Multinomial naive Bayes classifier of transaction descriptions.
+    The model is just a few counters per category, so it can be stored as JSON
+    and updated incrementally with every imported transaction. Its vocabulary
+    is capped to `max_tokens` features, the rarest ones being forgotten first.
+    """
+
+    # Share of `max_tokens` kept when pruning, so the model is not pruned again
+    # at the next example
+    PRUNE_RATIO = 0.9
+
+    def __init__(self, data=None, max_tokens=None):
+        data = data or {}
+        self.documents = data.get("documents", {})
+        self.tokens = data.get("tokens", {})
+        self.totals = data.get("totals", {})
+        self.vocabulary = {token for counts in self.tokens.values() for token in counts}
+        self.max_tokens = max_tokens or settings.LOCAL_CLASSIFIER_MAX_TOKENS
+        self.changed = False
+
+    @property
+    def total_documents(self):
+        return sum(self.documents.values())
+
+    def learn(self, description, txn_type, label):
+        """
+        Add a categorized transaction to the model.
+        """
+        counts = self.tokens.setdefault(label, {})
+        tokens = tokenize(description, txn_type)
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+            self.vocabulary.add(token)
+        self.totals[label] = self.totals.get(label, 0) + len(tokens)
+        self.documents[label] = self.documents.get(label, 0) + 1
+        self.changed = True
+        if len(self.vocabulary) > self.max_tokens:
+            self.prune()
+
+    def prune(self):
+        """
+        Forget the least frequent features until the vocabulary is down to
+        PRUNE_RATIO of `max_tokens`, removing their counts from the totals.
+        """
+        frequency = Counter()
+        for counts in self.tokens.values():
+            frequency.update(counts)
+        excess = len(frequency) - int(self.max_tokens * self.PRUNE_RATIO)
+        rare = {
+            token
+            for token, _ in sorted(frequency.items(), key=lambda item: item[1])[:excess]
+        }
+
+        for label, counts in self.tokens.items():
+            for token in rare & counts.keys():
+                self.totals[label] -= counts.pop(token)
+        self.vocabulary -= rare
+        self.changed = True
+
+    def predict(self, description, txn_type):
+        """
+        Return the most likely category and its probability.
+        """
+        if not self.documents:
+            return None, 0.0
+
+        tokens = tokenize(description, txn_type)
+        vocabulary = len(self.vocabulary) + 1
+        total = self.total_documents
+
+        scores = {}
+        for label, documents in self.documents.items():
+            counts = self.tokens.get(label, {})
+            denominator = self.totals.get(label, 0) + vocabulary
+            scores[label] = math.log(documents / total) + sum(
+                math.log((counts.get(token, 0) + 1) / denominator) for token in tokens
+            )
+
+        best = max(scores, key=scores.get)
+        probability = 1 / sum(
+            math.exp(score - scores[best]) for score in scores.values()
+        )
+        return best, probability
+
+    def classify(self, description, txn_type):
+        """
+        Return the predicted category only when the model has seen at least
+        LOCAL_CLASSIFIER_MIN_DOCUMENTS transactions and its confidence reaches
+        LOCAL_CLASSIFIER_THRESHOLD, None otherwise.
+        """
+        if self.total_documents < settings.LOCAL_CLASSIFIER_MIN_DOCUMENTS:
+            return None
+
+        label, probability = self.predict(description, txn_type)
+        if probability < settings.LOCAL_CLASSIFIER_THRESHOLD:
+            return None
+        return label
+
+    def to_dict(self):
+        return {
+            "documents": self.documents,
+            "tokens": self.tokens,
+            "totals": self.totals,
+        }
+
+
+def load_classifier(user, importer, categories, examples_per_category, fallback):
+    """
+    Load the user's classifier for an importer. The first time, it is trained
+    from the user's already categorized transactions and the importer examples.
+    """
+    stored = CategorizerModel.objects.filter(user=user, importer=importer).first()
+    if stored:
+        return NaiveBayesClassifier(stored.data)
+
+    classifier = NaiveBayesClassifier()
+    for label, examples in examples_per_category.items():
+        if label not in categories:
+            continue
+        txn_type = "IN" if categories[label]["is_income"] else "OUT"
+        for example in examples:
+            classifier.learn(example, txn_type, label)
+
+    history = (
+        Transaction.objects.filter(
+            bank_account__user=user,
+            category__created_by=user,
+            category__importer=importer,
+        )
+        .exclude(category__name=fallback)
+        .values_list("description", "txn_type", "category__name")
+    )
+    for description, txn_type, label in history.iterator(chunk_size=2000):
+        if label in categories:
+            classifier.learn(description, txn_type, label)
+
+    return classifier
+
+
+def save_classifier(user, importer, classifier):
+    """
+    Store the classifier, if it learned anything since it was loaded.
+    """
+    if not classifier.changed:
+        return
+
+    CategorizerModel.objects.update_or_create(
+        user=user, importer=importer, defaults={"data": classifier.to_dict()}
+    )
+    classifier.changed = False
@@ -0,0 +1,257 @@
+import hmac
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+
+class Metric:
+    """
+    Metric kept in process memory, with one value per combination of labels,
+    rendered in the Prometheus text format.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = Lock()
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def format_labels(self, key, extra=()):
+        pairs = [*zip(self.labelnames, key), *extra]
+        if not pairs:
+            return ""
+        return (
+            "{"
+            + ",".join(
+                '{}="{}"'.format(
+                    name,
+                    value.replace("\\", "\\\\")
+                    .replace('"', '\\"')
+                    .replace("\n", "\\n"),
+                )
+                for name, value in pairs
+            )
+            + "}"
+        )
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self.lock:
+            values = [
+                (key, list(value) if isinstance(value, list) else value)
+                for key, value in sorted(self.values.items())
+            ]
+        for key, value in values:
+            lines.extend(self.render_value(key, value))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render_value(self, key, value):
+        return [f"{self.name}{self.format_labels(key)} {value}"]
+
+
+class Histogram(Metric):
+    """
+    Histogram whose value is the count of observations per bucket, followed by
+    the overall count and sum.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            data = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += 1
+            data[-1] += value
+
+    def render_value(self, key, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value):
+            cumulative += count
+            labels = self.format_labels(key, [("le", str(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = self.format_labels(key, [("le", "+Inf")])
+        lines.append(f"{self.name}_bucket{labels} {value[-2]}")
+        lines.append(f"{self.name}_count{self.format_labels(key)} {value[-2]}")
+        lines.append(f"{self.name}_sum{self.format_labels(key)} {value[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics of the process, exposed by the /metrics view and by the import
+    worker's metrics server.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=()):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return (
+            "\n".join(line for metric in self.metrics for line in metric.render())
+            + "\n"
+        )
+
+
+registry = Registry()
+
+OPERATIONS = registry.counter(
+    "sossoldi_operations_total", "Completed imports and exports.", ("operation", "bank")
+)
+ROWS = registry.counter(
+    "sossoldi_rows_total",
+    "Rows processed by imports and exports, by outcome.",
+    ("operation", "bank", "outcome"),
+)
+STAGE_SECONDS = registry.counter(
+    "sossoldi_stage_seconds_total",
+    "Wall time spent in each stage of imports and exports.",
+    ("operation", "stage"),
+)
+STAGE_QUERIES = registry.counter(
+    "sossoldi_stage_queries_total",
+    "Database queries run by each stage of imports and exports.",
+    ("operation", "stage"),
+)
+PREDICTIONS = registry.counter(
+    "sossoldi_category_predictions_total",
+    "Categories assigned during imports, by source.",
+    ("source",),
+)
+OLLAMA_SECONDS = registry.histogram(
+    "sossoldi_ollama_request_seconds",
+    "Latency of the calls to Ollama.",
+    ("outcome",),
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+def scrape_allowed(authorization, token):
+    """
+    Tell whether an Authorization header carries the bearer `token` required
+    to read the metrics. Without a token the metrics are not served at all.
+    """
+    if not token:
+        return False
+    scheme, _, credentials = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        credentials.strip().encode(), token.encode()
+    )
+
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """
+    Log a structured line made of the event name followed by key=value pairs.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(
+            level,
+            "%s %s",
+            event,
+            " ".join(f"{key}={value}" for key, value in fields.items()),
+        )
+
+
+class StageTimer:
+    """
+    Accumulate the wall time, the queries and the items of each stage of an
+    import or export. Installed as a database execute wrapper, it attributes
+    every query of the current thread to the stage running at that moment.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.seconds = defaultdict(float)
+        self.queries = defaultdict(int)
+        self.items = defaultdict(int)
+        self.current = "other"
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries[self.current] += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def stage(self, name):
+        previous = self.current
+        self.current = name
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += perf_counter() - start
+            self.current = previous
+
+    def timed(self, name, iterable):
+        """
+        Yield the items of `iterable`, timing only the work done to produce them.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            self.items[name] += 1
+            yield item
+
+    @property
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    def as_dict(self):
+        return {
+            stage: {"seconds": round(seconds, 4), "queries": self.queries[stage]}
+            for stage, seconds in self.seconds.items()
+        }
+
+    def publish(self):
+        """
+        Add the stages of this run to the process metrics.
+        """
+        for stage in set(self.seconds) | set(self.queries):
+            STAGE_SECONDS.inc(
+                self.seconds[stage], operation=self.operation, stage=stage
+            )
+            STAGE_QUERIES.inc(
+                self.queries[stage], operation=self.operation, stage=stage
+            )
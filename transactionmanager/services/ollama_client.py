@@ -0,0 +1,129 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import OLLAMA_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when Ollama is not called because it has been failing or too slow.
+    """
+
+
+class OllamaResponseError(requests.RequestException):
+    """
+    Raised when Ollama answers with a payload that is not a generated text.
+    A RequestException, so callers handle it like a failed call.
+    """
+
+
+class CircuitBreaker:
+    """
+    Count consecutive failed or slow calls and open once `max_failures` is
+    reached. The breaker stays open for the lifetime of the client, so the rest
+    of an import falls back to the default category instead of waiting on
+    Ollama again.
+    """
+
+    def __init__(self, max_failures, slow_call_seconds):
+        self.max_failures = max_failures
+        self.slow_call_seconds = slow_call_seconds
+        self.failures = 0
+        self.lock = Lock()
+
+    @property
+    def is_open(self):
+        return self.failures >= self.max_failures
+
+    def record(self, duration=None, failed=False):
+        with self.lock:
+            if failed or duration > self.slow_call_seconds:
+                self.failures += 1
+                if self.failures == self.max_failures:
+                    logger.warning(
+                        "Ollama failed or was slow %d times in a row, "
+                        "using the fallback category for the rest of the import.",
+                        self.failures,
+                    )
+            else:
+                self.failures = 0
+
+
+class OllamaClient:
+    """
+    Ollama client for one import: keeps a pooled HTTP session, applies a timeout
+    to every call, runs calls on a bounded thread pool and stops calling Ollama
+    when the circuit breaker opens.
+    """
+
+    def __init__(self, url=None, timeout=None, concurrency=None, max_failures=None):
+        self.url = url or settings.OLLAMA_API_URL
+        self.timeout = timeout or settings.OLLAMA_TIMEOUT
+        concurrency = concurrency or settings.OLLAMA_CONCURRENCY
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="ollama"
+        )
+        self.breaker = CircuitBreaker(
+            max_failures or settings.OLLAMA_MAX_FAILURES,
+            settings.OLLAMA_SLOW_CALL_SECONDS,
+        )
+
+    def generate(self, prompt, model="llama3", response_format=None):
+        """
+        Send a prompt to Ollama and return the generated text.
+        Raises a requests.RequestException (OllamaResponseError for a malformed
+        answer) or CircuitOpenError when the call fails or is not attempted.
+        """
+        if self.breaker.is_open:
+            raise CircuitOpenError(
+                "Ollama is unavailable, using the fallback category."
+            )
+
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        if response_format:
+            payload["format"] = response_format
+
+        start = time.monotonic()
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            try:
+                text = response.json()["response"].strip()
+            except (ValueError, KeyError, TypeError, AttributeError) as error:
+                raise OllamaResponseError(
+                    f"Malformed Ollama response: {error!r}", response=response
+                ) from error
+        except requests.RequestException:
+            OLLAMA_SECONDS.observe(time.monotonic() - start, outcome="error")
+            self.breaker.record(failed=True)
+            raise
+
+        duration = time.monotonic() - start
+        OLLAMA_SECONDS.observe(duration, outcome="ok")
+        self.breaker.record(duration=duration)
+        return text
+
+    def map(self, func, items):
+        """
+        Apply `func` to every item on the thread pool, returning the results in
+        the same order as `items`.
+        """
+        return list(self.executor.map(func, items))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
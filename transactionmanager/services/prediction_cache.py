@@ -0,0 +1,127 @@
+import re
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+
+from ..models import CategoryPrediction
+
+NOISE_RE = re.compile(r"[^A-Z ]+")
+
+
+def normalize_merchant(text):
+    """
+    Reduce a partner name or description to a stable merchant key: upper case,
+    without digits, punctuation and repeated whitespace, so that card numbers,
+    dates and references do not split the same merchant into many keys.
+    """
+    return " ".join(NOISE_RE.sub(" ", (text or "").upper()).split())[:200]
+
+
+def prediction_keys(txn_types, merchants):
+    """
+    Build the cache keys of a column of rows from their transaction types and
+    merchant texts, normalizing each distinct merchant once. The key is None
+    where the merchant is empty once normalized.
+    """
+    normalized = {}
+    keys = []
+    for txn_type, merchant in zip(txn_types, merchants):
+        if merchant not in normalized:
+            normalized[merchant] = normalize_merchant(merchant)
+        keys.append(
+            f"{txn_type}|{normalized[merchant]}" if normalized[merchant] else None
+        )
+    return keys
+
+
+class LRUCache:
+    """
+    Thread-safe mapping that evicts the least recently used entry when full.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+
+memory_cache = LRUCache(settings.CATEGORY_CACHE_SIZE)
+
+
+class PredictionCache:
+    """
+    Two-level cache of predicted categories for one import: the in-process LRU
+    first, then the CategoryPrediction table. Hits and misses are counted so
+    they can be reported with the import result.
+    """
+
+    def __init__(self, user, importer):
+        self.user = user
+        self.importer = importer
+        self.hits = 0
+        self.misses = 0
+
+    def memory_key(self, key):
+        return (self.user.pk, self.importer, key)
+
+    def get_many(self, keys):
+        """
+        Return a dict with the cached category name of each of the given keys
+        that is known, querying the database once for the keys not in memory.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            name = memory_cache.get(self.memory_key(key))
+            if name is None:
+                missing.append(key)
+            else:
+                found[key] = name
+
+        if missing:
+            stored = CategoryPrediction.objects.filter(
+                user=self.user, importer=self.importer, key__in=missing
+            ).values_list("key", "category_name")
+            for key, name in stored:
+                memory_cache.set(self.memory_key(key), name)
+                found[key] = name
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, predictions):
+        """
+        Store a dict of key -> category name in both cache levels.
+        """
+        if not predictions:
+            return
+
+        CategoryPrediction.objects.bulk_create(
+            [
+                CategoryPrediction(
+                    user=self.user, importer=self.importer, key=key, category_name=name
+                )
+                for key, name in predictions.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "importer", "key"],
+            update_fields=["category_name", "updated_at"],
+        )
+        for key, name in predictions.items():
+            memory_cache.set(self.memory_key(key), name)
@@ -0,0 +1,112 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Transaction
+from .data_version import bump_data_version
+from .rollups import RollupDeltas
+
+
+def reconcile_transfers(
+    user, accounts=None, date_from=None, date_to=None, window_days=None
+):
+    """
+    Link the incoming legs of the user's internal transfers to their outgoing
+    TRSF leg, so each transfer is exported once.
+    An outgoing leg matches an unlinked income of its transfer account with the
+    same amount, dated within `window_days`, the closest one first.
+    After an import only the transfers from or to the imported `accounts`, and
+    dated between `date_from` and `date_to` give or take the window, can find a
+    new match, so the other ones are not loaded at all. Both sides
+    are loaded with one query each and matched in memory on date-sorted lists
+    grouped by (account, amount), then the links are saved with a bulk update
+    and the linked incomes are moved to the transfers of their monthly rollups.
+    Returns the number of linked transactions.
+    """
+    window = timedelta(
+        days=settings.TRANSFER_MATCH_DAYS if window_days is None else window_days
+    )
+
+    outgoing = Transaction.objects.filter(
+        bank_account__user=user,
+        txn_type="TRSF",
+        transfer_account__isnull=False,
+        mirrors__isnull=True,
+    )
+    if accounts is not None:
+        outgoing = outgoing.filter(
+            Q(bank_account_id__in=accounts) | Q(transfer_account_id__in=accounts)
+        )
+    if date_from is not None:
+        outgoing = outgoing.filter(date__gte=date_from - window)
+    if date_to is not None:
+        outgoing = outgoing.filter(date__lte=date_to + window)
+    outgoing = list(
+        outgoing.order_by("date", "id").values_list(
+            "id", "transfer_account_id", "amount", "date"
+        )
+    )
+    if not outgoing:
+        return 0
+
+    incoming = (
+        Transaction.objects.filter(
+            bank_account_id__in={account for _, account, _, _ in outgoing},
+            txn_type="IN",
+            linked_transfer__isnull=True,
+            date__gte=outgoing[0][3] - window,
+            date__lte=outgoing[-1][3] + window,
+        )
+        .order_by("date", "id")
+        .values_list("id", "bank_account_id", "amount", "date", "category_id")
+    )
+    legs = defaultdict(lambda: ([], []))
+    categories = {}
+    for pk, account, amount, date, category in incoming:
+        dates, pks = legs[(account, amount)]
+        dates.append(date)
+        pks.append(pk)
+        categories[pk] = category
+
+    links = {}
+    deltas = RollupDeltas()
+    for pk, account, amount, date in outgoing:
+        if (account, amount) not in legs:
+            continue
+        dates, pks = legs[(account, amount)]
+
+        best = None
+        index = bisect_left(dates, date - window)
+        while index < len(dates) and dates[index] <= date + window:
+            if pks[index] not in links and (
+                best is None or abs(dates[index] - date) < abs(dates[best] - date)
+            ):
+                best = index
+            index += 1
+        if best is not None:
+            mirror = pks[best]
+            links[mirror] = pk
+            deltas.add(account, categories[mirror], dates[best], "IN", amount, sign=-1)
+            deltas.add(
+                account, categories[mirror], dates[best], "IN", amount, linked=True
+            )
+
+    if links:
+        now = timezone.now()
+        with transaction.atomic():
+            Transaction.objects.bulk_update(
+                [
+                    Transaction(id=pk, linked_transfer_id=transfer, updated_at=now)
+                    for pk, transfer in links.items()
+                ],
+                ["linked_transfer", "updated_at"],
+                batch_size=500,
+            )
+            deltas.apply()
+        bump_data_version(user.pk)
+    return len(links)
@@ -0,0 +1,175 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from ..models import MonthlyRollup, Transaction
+
+COLUMNS = ("income", "expense", "transfers_in", "transfers_out")
+
+
+def rollup_column(txn_type, linked):
+    """
+    Column of MonthlyRollup a transaction is added to.
+    """
+    if txn_type == "TRSF":
+        return "transfers_out"
+    if linked:
+        return "transfers_in"
+    return "income" if txn_type == "IN" else "expense"
+
+
+def rollup_month(date):
+    return timezone.localtime(date).date().replace(day=1)
+
+
+def empty_cell():
+    return {**dict.fromkeys(COLUMNS, Decimal(0)), "count": 0}
+
+
+class RollupDeltas:
+    """
+    Changes to the monthly rollups, accumulated per (account, category, month)
+    cell so that only the affected cells are written, all at once.
+    """
+
+    def __init__(self):
+        self.cells = defaultdict(empty_cell)
+        # Rows of an import share few dates, each converted to its month once
+        self.months = {}
+
+    def add(
+        self, account_id, category_id, date, txn_type, amount, linked=False, sign=1
+    ):
+        month = self.months.get(date)
+        if month is None:
+            month = self.months[date] = rollup_month(date)
+        cell = self.cells[(account_id, category_id, month)]
+        cell[rollup_column(txn_type, linked)] += sign * amount
+        cell["count"] += sign
+
+    def add_transaction(self, txn, sign=1):
+        self.add(
+            txn.bank_account_id,
+            txn.category_id,
+            txn.date,
+            txn.txn_type,
+            txn.amount,
+            txn.linked_transfer_id is not None,
+            sign,
+        )
+
+    def apply(self):
+        """
+        Add the deltas to their cells: the cells are locked with one query, then
+        written with one bulk update. Missing cells are first inserted empty,
+        ignoring the ones a concurrent transaction has just created, and locked
+        in turn. Cells left without transactions are deleted.
+        Removals from a cell that no longer exists (e.g. while its account is
+        being deleted) are ignored.
+        """
+        cells = {key: delta for key, delta in self.cells.items() if any(delta.values())}
+        self.cells.clear()
+        if not cells:
+            return
+
+        with transaction.atomic():
+            existing = lock_cells(cells)
+            missing = [
+                key
+                for key, delta in cells.items()
+                if key not in existing and delta["count"] > 0
+            ]
+            if missing:
+                MonthlyRollup.objects.bulk_create(
+                    [
+                        MonthlyRollup(
+                            bank_account_id=account, category_id=category, month=month
+                        )
+                        for account, category, month in missing
+                    ],
+                    ignore_conflicts=True,
+                )
+                existing.update(lock_cells(missing))
+
+            changed, emptied = [], []
+            for key, delta in cells.items():
+                rollup = existing.get(key)
+                if rollup is None:
+                    continue
+                if rollup.count + delta["count"] <= 0:
+                    emptied.append(rollup.pk)
+                    continue
+                for column, value in delta.items():
+                    setattr(rollup, column, getattr(rollup, column) + value)
+                changed.append(rollup)
+
+            if changed:
+                MonthlyRollup.objects.bulk_update(changed, [*COLUMNS, "count"])
+            if emptied:
+                MonthlyRollup.objects.filter(pk__in=emptied).delete()
+
+
+def lock_cells(keys):
+    """
+    Select for update the existing rollups of the given (account, category,
+    month) cells, by cell.
+    """
+    keys = set(keys)
+    return {
+        (rollup.bank_account_id, rollup.category_id, rollup.month): rollup
+        for rollup in MonthlyRollup.objects.select_for_update().filter(
+            bank_account_id__in={account for account, _, _ in keys},
+            month__in={month for _, _, month in keys},
+        )
+        if (rollup.bank_account_id, rollup.category_id, rollup.month) in keys
+    }
+
+
+def rollup_cells(transactions):
+    """
+    Totals of a queryset of transactions per (account, category, month) cell,
+    computed with a single grouped query.
+    """
+    cells = defaultdict(empty_cell)
+    rows = (
+        transactions.annotate(
+            month=TruncMonth("date"),
+            linked=ExpressionWrapper(
+                Q(linked_transfer__isnull=False), output_field=BooleanField()
+            ),
+        )
+        .values("bank_account_id", "category_id", "month", "txn_type", "linked")
+        .annotate(total=Sum("amount"), transactions=Count("id"))
+        .order_by()
+    )
+    for row in rows:
+        cell = cells[
+            (row["bank_account_id"], row["category_id"], rollup_month(row["month"]))
+        ]
+        cell[rollup_column(row["txn_type"], row["linked"])] += row["total"]
+        cell["count"] += row["transactions"]
+    return cells
+
+
+def rebuild_rollups(accounts):
+    """
+    Recompute from scratch the rollups of the given bank accounts.
+    Returns the number of rollups written.
+    """
+    cells = rollup_cells(Transaction.objects.filter(bank_account__in=accounts))
+    with transaction.atomic():
+        MonthlyRollup.objects.filter(bank_account__in=accounts).delete()
+        MonthlyRollup.objects.bulk_create(
+            [
+                MonthlyRollup(
+                    bank_account_id=account, category_id=category, month=month, **cell
+                )
+                for (account, category, month), cell in cells.items()
+            ],
+            batch_size=500,
+        )
+    return len(cells)
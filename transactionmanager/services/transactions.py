@@ -0,0 +1,96 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+# Columns of the transactions returned by the listing and the JSON API
+PAGE_FIELDS = (
+    "id",
+    "date",
+    "amount",
+    "txn_type",
+    "description",
+    "category_id",
+    "category__name",
+    "transfer_account_id",
+    "linked_transfer_id",
+)
+
+
+def encode_cursor(date, pk):
+    """
+    Encode the position after a transaction into an opaque cursor.
+    """
+    return urlsafe_b64encode(f"{date.isoformat()}|{pk}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor into the (date, id) it points after.
+    Raises ValueError if the cursor is not valid.
+    """
+    try:
+        value = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date, pk = value.split("|")
+        date = datetime.fromisoformat(date)
+        pk = int(pk)
+    except (TypeError, UnicodeDecodeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+    if timezone.is_naive(date):
+        raise ValueError("Invalid cursor")
+    return date, pk
+
+
+def filter_transactions(
+    queryset, category=None, txn_type=None, date_from=None, date_to=None
+):
+    """
+    Narrow the transactions of an account to a category, a type and a range of
+    days (both included). Each filter is served by an index starting with the
+    account and ending with (date, id), so the pages keep their order.
+    """
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    if txn_type:
+        queryset = queryset.filter(txn_type=txn_type)
+    if date_from:
+        queryset = queryset.filter(
+            date__gte=timezone.make_aware(datetime.combine(date_from, time.min))
+        )
+    if date_to:
+        queryset = queryset.filter(
+            date__lt=timezone.make_aware(
+                datetime.combine(date_to + timedelta(days=1), time.min)
+            )
+        )
+    return queryset
+
+
+def page_queryset(queryset, cursor=None, limit=50):
+    """
+    Query of a page of transactions, newest first, with one more row than
+    `limit` to tell whether another page follows.
+    The page seeks past the (date, id) of the cursor instead of counting the
+    rows before it, so every page costs the same whatever its position.
+    """
+    if cursor is not None:
+        date, pk = cursor
+        # The first condition bounds the index scan, the second one skips the
+        # transactions of the same moment already returned
+        queryset = queryset.filter(date__lte=date).filter(
+            Q(date__lt=date) | Q(id__lt=pk)
+        )
+    return queryset.order_by("-date", "-id").values(*PAGE_FIELDS)[: limit + 1]
+
+
+def transaction_page(queryset, cursor=None, limit=50):
+    """
+    Return a page of transactions, newest first, and the cursor of the next
+    page (None on the last one).
+    """
+    rows = list(page_queryset(queryset, cursor, limit))
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["date"], rows[-1]["id"])
@@ -0,0 +1,126 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import BankAccount, Category, ImportedFile, MonthlyRollup, Transaction
+from .services.account_summary import invalidate_account_summary
+from .services.data_version import account_owner, bump_data_version
+from .services.rollups import COLUMNS, RollupDeltas
+
+
+def cascaded(origin, model):
+    """
+    Tell whether an instance of `model` is deleted because its bank account or
+    user is: that deletion handles the rows as a whole, not one by one.
+    """
+    if origin is None:
+        return False
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model is not model
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+def transaction_changed(sender, instance, **kwargs):
+    if cascaded(kwargs.get("origin"), Transaction):
+        return
+    user_id = account_owner(instance.bank_account_id)
+    if user_id:
+        bump_data_version(user_id)
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    if cascaded(kwargs.get("origin"), Transaction):
+        return
+    # Deleted rows must be imported again, so earlier files can no longer be skipped
+    ImportedFile.objects.filter(bank_account_id=instance.bank_account_id).delete()
+
+
+@receiver(pre_save, sender=Transaction)
+def transaction_saving(sender, instance, **kwargs):
+    # Keep the stored row, whose amount must leave its rollup once saved
+    instance._rollup_previous = None
+    if not instance._state.adding and instance.pk:
+        instance._rollup_previous = Transaction.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, **kwargs):
+    deltas = RollupDeltas()
+    previous = getattr(instance, "_rollup_previous", None)
+    if previous is not None:
+        deltas.add_transaction(previous, sign=-1)
+    deltas.add_transaction(instance)
+    deltas.apply()
+
+
+@receiver(pre_delete, sender=Transaction)
+def transaction_deleting(sender, instance, **kwargs):
+    if cascaded(kwargs.get("origin"), Transaction):
+        return
+    # The incoming legs linked to this transfer are unlinked without signals,
+    # and become income again
+    instance._rollup_mirrors = []
+    if instance.txn_type == "TRSF":
+        instance._rollup_mirrors = list(instance.mirrors.exclude(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_removed(sender, instance, **kwargs):
+    if cascaded(kwargs.get("origin"), Transaction):
+        return
+    deltas = RollupDeltas()
+    deltas.add_transaction(instance, sign=-1)
+    for mirror in getattr(instance, "_rollup_mirrors", []):
+        deltas.add_transaction(mirror, sign=-1)
+        mirror.linked_transfer_id = None
+        deltas.add_transaction(mirror)
+    deltas.apply()
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    if cascaded(kwargs.get("origin"), Category):
+        return
+    # Its transactions are left without a category, so its rollups are merged
+    # into the uncategorized ones before being deleted with it
+    deltas = RollupDeltas()
+    for rollup in MonthlyRollup.objects.filter(category=instance):
+        for category_id, sign in ((instance.pk, -1), (None, 1)):
+            cell = deltas.cells[(rollup.bank_account_id, category_id, rollup.month)]
+            for column in (*COLUMNS, "count"):
+                cell[column] += sign * getattr(rollup, column)
+    deltas.apply()
+
+
+@receiver(pre_delete, sender=BankAccount)
+def bank_account_deleting(sender, instance, **kwargs):
+    # Along with the user, every related row goes through the database cascade
+    if cascaded(kwargs.get("origin"), BankAccount):
+        return
+    MonthlyRollup.objects.filter(bank_account=instance).delete()
+    ImportedFile.objects.filter(bank_account=instance).delete()
+
+    # Incomes of other accounts linked to the transfers of this one are unlinked
+    # without signals, and become income again
+    deltas = RollupDeltas()
+    for mirror in Transaction.objects.filter(
+        linked_transfer__bank_account=instance
+    ).exclude(bank_account=instance):
+        deltas.add_transaction(mirror, sign=-1)
+        mirror.linked_transfer_id = None
+        deltas.add_transaction(mirror)
+    deltas.apply()
+
+
+@receiver([post_save, post_delete], sender=BankAccount)
+def bank_account_changed(sender, instance, **kwargs):
+    invalidate_account_summary(instance.user_id)
+    if not cascaded(kwargs.get("origin"), BankAccount):
+        bump_data_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    if not cascaded(kwargs.get("origin"), Category):
+        bump_data_version(instance.created_by_id)
@@ -1 +1,704 @@
-# Create your tests here.
+import csv
+import io
+import json
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmarks.synthetic import HEADER
+from .importers.base_importer import BaseBankImporter
+from .models import BankAccount, Category, ImportJob, MonthlyRollup, Transaction
+from .services import prediction_cache
+from .services.dispatcher import dispatch_import
+from .services.local_classifier import NaiveBayesClassifier
+from .services.ollama_client import OllamaClient
+from .services.reconciliation import reconcile_transfers
+from .services.rollups import rebuild_rollups
+from .services.transactions import (
+    decode_cursor,
+    encode_cursor,
+    filter_transactions,
+    page_queryset,
+    transaction_page,
+)
+
+User = get_user_model()
+
+
+def create_transactions(account, categories, count):
+    """
+    Store `count` transactions on `account`, spread over the given categories
+    and over one transaction a day.
+    """
+    now = timezone.now()
+    Transaction.objects.bulk_create(
+        Transaction(
+            bank_account=account,
+            category=categories[index % len(categories)],
+            date=now - timedelta(days=index),
+            amount=Decimal(index % 500) + Decimal("0.99"),
+            txn_type="OUT",
+            description=f"Pagamento {index}",
+            fingerprint=f"{index:064d}",
+        )
+        for index in range(count)
+    )
+
+
+def n26_file(rows, name="n26.csv"):
+    """
+    Build an uploaded N26 CSV export from (date, partner, partner IBAN, type,
+    amount, reference) tuples.
+    """
+    output = io.StringIO(newline="")
+    writer = csv.writer(output)
+    writer.writerow(HEADER)
+    for day, partner, iban, kind, amount, reference in rows:
+        writer.writerow(
+            [day, day, partner, iban, kind, reference, "Main", amount, "", "", ""]
+        )
+    return ContentFile(output.getvalue().encode(), name=name)
+
+
+class ExportQueryCountTests(TestCase):
+    """
+    The export runs a fixed number of queries, whatever the number of
+    transactions.
+    """
+
+    EXPORT_QUERIES = 14
+
+    def setUp(self):
+        # Exports and account summaries cached by other tests share the same keys
+        for alias in ("default", "exports"):
+            caches[alias].clear()
+        self.user = User.objects.create_user(
+            "mario", password="password", first_name="Mario", last_name="Rossi"
+        )
+        self.account = BankAccount.objects.create(
+            user=self.user,
+            name="Main",
+            iban="IT00X0000000000000000000001",
+            bank_type="n26",
+        )
+        BankAccount.objects.create(
+            user=self.user,
+            name="Savings",
+            iban="IT00X0000000000000000000002",
+            bank_type="n26",
+        )
+        self.categories = [
+            Category.objects.create(
+                name=name, icon="icon", txn_type="OUT", created_by=self.user
+            )
+            for name in ("Spesa", "Trasporti", "Casa")
+        ]
+        self.client.force_login(self.user)
+
+    def assertExportQueries(self, count):
+        create_transactions(self.account, self.categories, count)
+        with self.assertNumQueries(self.EXPORT_QUERIES):
+            response = self.client.get("/export/?mode=full")
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content.count("Pagamento "), count)
+
+    def test_export_10_transactions(self):
+        self.assertExportQueries(10)
+
+    def test_export_10000_transactions(self):
+        self.assertExportQueries(10000)
+
+
+class TransactionIndexTests(TestCase):
+    """
+    The listings and the import lookups of an account are served by its indexes.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "mario", first_name="Mario", last_name="Rossi"
+        )
+        self.account = BankAccount.objects.create(
+            user=self.user,
+            name="Main",
+            iban="IT00X0000000000000000000001",
+            bank_type="n26",
+        )
+        self.category = Category.objects.create(
+            name="Spesa", icon="icon", txn_type="OUT", created_by=self.user
+        )
+        create_transactions(self.account, [self.category], 500)
+
+    def listing_plan(self, **filters):
+        """
+        Plan of the second page of the account listing, as built by its views.
+        """
+        queryset = filter_transactions(
+            Transaction.objects.filter(bank_account=self.account), **filters
+        )
+        _, cursor = transaction_page(queryset, limit=50)
+        return page_queryset(queryset, decode_cursor(cursor), limit=50).explain()
+
+    def test_account_listing_uses_date_index(self):
+        plan = self.listing_plan(
+            date_from=(timezone.now() - timedelta(days=300)).date()
+        )
+        self.assertIn("txn_account_date_idx", plan)
+
+    def test_category_listing_uses_category_index(self):
+        plan = self.listing_plan(category=self.category)
+        self.assertIn("txn_account_category_date_idx", plan)
+
+    def test_type_listing_uses_type_index(self):
+        plan = self.listing_plan(txn_type="OUT")
+        self.assertIn("txn_account_type_date_idx", plan)
+
+    def fingerprint_index_names(self):
+        """
+        Names the database gives to the index of the unique (bank_account,
+        fingerprint) constraint: SQLite creates it as an automatic index.
+        """
+        names = {"unique_transaction_fingerprint"}
+        if connection.vendor == "sqlite":
+            table = Transaction._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute(f"PRAGMA index_list({table})")
+                for _, name, unique, *_ in cursor.fetchall():
+                    cursor.execute(f"PRAGMA index_info('{name}')")
+                    columns = [row[2] for row in cursor.fetchall()]
+                    if unique and columns == ["bank_account_id", "fingerprint"]:
+                        names.add(name)
+        return names
+
+    def test_fingerprint_lookup_uses_unique_index(self):
+        plan = Transaction.objects.filter(
+            bank_account=self.account,
+            fingerprint__in=[f"{index:064d}" for index in range(10)],
+        ).explain()
+        self.assertTrue(
+            any(name in plan for name in self.fingerprint_index_names()), plan
+        )
+
+
+@override_settings(
+    OLLAMA_ENABLE=True, LOCAL_CLASSIFIER_ENABLE=False, OLLAMA_BATCH_SIZE=20
+)
+class BatchPredictionTests(TestCase):
+    """
+    Malformed answers of a batch prompt fall back to a prompt per row.
+    """
+
+    def setUp(self):
+        prediction_cache.memory_cache.data.clear()
+        self.user = User.objects.create_user(
+            "mario", first_name="Mario", last_name="Rossi"
+        )
+        BankAccount.objects.create(
+            user=self.user,
+            name="Main",
+            iban="IT00X0000000000000000000001",
+            bank_type="n26",
+        )
+
+    def generate(self, client, prompt, model="llama3", response_format=None):
+        if response_format == "json":
+            return json.dumps(
+                {"1": ["Shopping"], "2": {"name": "Shopping"}, "3": 7, "4": "Shopping"}
+            )
+        return "Shopping"
+
+    def test_non_text_answers_are_predicted_again(self):
+        file = n26_file(
+            (f"2024-01-0{day}", f"NEGOZIO {name}", "", "Debit Card", "-10.00", "")
+            for day, name in enumerate(("UNO", "DUE", "TRE", "QUATTRO"), start=1)
+        )
+        with mock.patch.object(
+            OllamaClient, "generate", side_effect=self.generate, autospec=True
+        ) as generate:
+            result = dispatch_import(
+                file=file,
+                user=self.user,
+                bank_format="n26",
+                iban="IT00X0000000000000000000001",
+            )
+
+        self.assertEqual(result["inserted"], 4)
+        self.assertEqual(
+            [
+                call.kwargs.get("response_format") for call in generate.call_args_list
+            ].count(None),
+            3,
+        )
+        self.assertEqual(
+            set(Transaction.objects.values_list("category__name", flat=True)),
+            {"Shopping"},
+        )
+
+
+class LocalClassifierTests(TestCase):
+    """
+    The local classifier keeps consistent totals and a bounded vocabulary.
+    """
+
+    def test_vocabulary_is_capped(self):
+        classifier = NaiveBayesClassifier(max_tokens=100)
+        for index in range(500):
+            label = "Shopping" if index % 2 else "Altro"
+            name = "".join(chr(ord("A") + int(digit)) for digit in str(index))
+            classifier.learn(f"NEGOZIO {name}", "OUT", label)
+
+        self.assertLessEqual(len(classifier.vocabulary), 100)
+        for label, counts in classifier.tokens.items():
+            self.assertEqual(classifier.totals[label], sum(counts.values()))
+            self.assertLessEqual(counts.keys(), classifier.vocabulary)
+        # The features shared by every example survive the pruning
+        self.assertIn("NEGOZIO", classifier.vocabulary)
+
+
+def purchases(start, count):
+    """
+    N26 rows of `count` card payments, one a day from day `start` of 2024.
+    """
+    first = date(2024, 1, 1)
+    return [
+        (
+            (first + timedelta(days=day)).isoformat(),
+            "NEGOZIO",
+            "",
+            "Debit Card",
+            f"-{day + 1}.00",
+            f"Acquisto {day}",
+        )
+        for day in range(start, start + count)
+    ]
+
+
+@override_settings(
+    OLLAMA_ENABLE=False, LOCAL_CLASSIFIER_ENABLE=False, IMPORT_BATCH_SIZE=10
+)
+class ReimportTests(TestCase):
+    """
+    The batches at the start of a file already imported on the account are
+    skipped without being parsed into transactions again.
+    """
+
+    IBAN = "IT00X0000000000000000000001"
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "mario", first_name="Mario", last_name="Rossi"
+        )
+        BankAccount.objects.create(
+            user=self.user, name="Main", iban=self.IBAN, bank_type="n26"
+        )
+
+    def import_rows(self, rows):
+        return dispatch_import(
+            file=n26_file(rows), user=self.user, bank_format="n26", iban=self.IBAN
+        )
+
+    def test_same_file_is_skipped(self):
+        rows = purchases(0, 24)
+        rows.insert(3, ("not a date", "NEGOZIO", "", "Debit Card", "-1.00", "Acquisto"))
+        self.import_rows(rows)
+
+        with mock.patch.object(BaseBankImporter, "import_batch") as import_batch:
+            result = self.import_rows(rows)
+
+        import_batch.assert_not_called()
+        self.assertEqual(result["inserted"], 0)
+        self.assertEqual(result["previously_imported"], 24)
+        self.assertEqual(result["duplicates"], 24)
+        self.assertEqual(result["skipped"], 1)
+        self.assertEqual(Transaction.objects.count(), 24)
+
+    def test_extended_file_imports_the_new_rows(self):
+        self.import_rows(purchases(0, 20))
+
+        result = self.import_rows(purchases(0, 27))
+
+        self.assertEqual(result["previously_imported"], 20)
+        self.assertEqual(result["inserted"], 7)
+        self.assertEqual(Transaction.objects.count(), 27)
+
+    def test_changed_file_is_checked_row_by_row(self):
+        self.import_rows(purchases(0, 20))
+
+        result = self.import_rows(purchases(1, 20))
+
+        self.assertEqual(result["previously_imported"], 0)
+        self.assertEqual(result["duplicates"], 19)
+        self.assertEqual(result["inserted"], 1)
+
+
+@override_settings(
+    OLLAMA_ENABLE=False, LOCAL_CLASSIFIER_ENABLE=False, TRANSFER_MATCH_DAYS=3
+)
+class TransferReconciliationTests(TestCase):
+    """
+    The incoming leg of an internal transfer is linked to its outgoing TRSF
+    leg, the closest income of the same amount within the window first.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "mario", first_name="Mario", last_name="Rossi"
+        )
+        self.main = BankAccount.objects.create(
+            user=self.user,
+            name="Main",
+            iban="IT00X0000000000000000000001",
+            bank_type="n26",
+        )
+        self.savings = BankAccount.objects.create(
+            user=self.user,
+            name="Savings",
+            iban="IT00X0000000000000000000002",
+            bank_type="n26",
+        )
+        self.day = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def transfer(self, amount="100.00", days=0):
+        return Transaction.objects.create(
+            bank_account=self.main,
+            transfer_account=self.savings,
+            date=self.day + timedelta(days=days),
+            amount=Decimal(amount),
+            txn_type="TRSF",
+        )
+
+    def income(self, amount="100.00", days=0):
+        return Transaction.objects.create(
+            bank_account=self.savings,
+            date=self.day + timedelta(days=days),
+            amount=Decimal(amount),
+            txn_type="IN",
+        )
+
+    def test_links_the_closest_income(self):
+        transfer = self.transfer()
+        far = self.income(days=2)
+        near = self.income(days=-1)
+
+        self.assertEqual(reconcile_transfers(self.user), 1)
+
+        near.refresh_from_db()
+        far.refresh_from_db()
+        self.assertEqual(near.linked_transfer, transfer)
+        self.assertIsNone(far.linked_transfer)
+
+    def test_ignores_other_amounts_and_dates_outside_the_window(self):
+        self.transfer()
+        other_amount = self.income(amount="99.99")
+        too_late = self.income(days=4)
+
+        self.assertEqual(reconcile_transfers(self.user), 0)
+
+        self.assertFalse(
+            Transaction.objects.filter(
+                pk__in=[other_amount.pk, too_late.pk], linked_transfer__isnull=False
+            ).exists()
+        )
+
+    def test_each_leg_is_linked_once(self):
+        first, second = self.transfer(), self.transfer(days=1)
+        self.income()
+        self.income(days=1)
+
+        self.assertEqual(reconcile_transfers(self.user), 2)
+        self.assertEqual(reconcile_transfers(self.user), 0)
+
+        linked = {
+            income.linked_transfer_id
+            for income in Transaction.objects.filter(txn_type="IN")
+        }
+        self.assertEqual(linked, {first.pk, second.pk})
+
+    def test_linked_income_moves_to_the_rollup_transfers(self):
+        self.transfer()
+        self.income()
+
+        reconcile_transfers(self.user)
+
+        rollup = MonthlyRollup.objects.get(bank_account=self.savings)
+        self.assertEqual(rollup.income, 0)
+        self.assertEqual(rollup.transfers_in, Decimal("100.00"))
+        self.assertEqual(rollup.count, 1)
+
+    def test_import_links_the_transfers_of_the_file(self):
+        self.income()
+
+        day = self.day.date().isoformat()
+        result = dispatch_import(
+            file=n26_file(
+                [
+                    (
+                        day,
+                        "Savings",
+                        self.savings.iban,
+                        "Debit Transfer",
+                        "-100.00",
+                        "Risparmi",
+                    )
+                ]
+            ),
+            user=self.user,
+            bank_format="n26",
+            iban=self.main.iban,
+        )
+
+        self.assertEqual(result["transfers_linked"], 1)
+        transfer = Transaction.objects.get(bank_account=self.main)
+        self.assertEqual(transfer.txn_type, "TRSF")
+        self.assertEqual(transfer.transfer_account, self.savings)
+        self.assertEqual(
+            Transaction.objects.get(bank_account=self.savings).linked_transfer, transfer
+        )
+
+
+class TransactionPagingTests(TestCase):
+    """
+    The transactions API walks an account newest first, one keyset page at a
+    time, and rejects cursors it did not issue.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "mario", first_name="Mario", last_name="Rossi"
+        )
+        self.account = BankAccount.objects.create(
+            user=self.user, name="Main", bank_type="n26"
+        )
+        self.category = Category.objects.create(
+            name="Spesa", txn_type="OUT", created_by=self.user
+        )
+        # Pairs of transactions on the same moment, so pages split between them
+        moment = timezone.now()
+        Transaction.objects.bulk_create(
+            Transaction(
+                bank_account=self.account,
+                category=self.category,
+                date=moment - timedelta(days=index // 2),
+                amount=Decimal(index + 1),
+                txn_type="OUT",
+                description=f"Pagamento {index}",
+            )
+            for index in range(23)
+        )
+        self.url = reverse("transaction_list_api", args=[self.account.pk])
+        self.client.force_login(self.user)
+
+    def test_pages_cover_every_transaction_once(self):
+        ids, cursor, pages = [], None, 0
+        while True:
+            params = {"limit": 5} if cursor is None else {"limit": 5, "cursor": cursor}
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            ids += [row["id"] for row in body["transactions"]]
+            pages += 1
+            cursor = body["next"]
+            if cursor is None:
+                break
+
+        expected = Transaction.objects.order_by("-date", "-id").values_list(
+            "id", flat=True
+        )
+        self.assertEqual(ids, list(expected))
+        self.assertEqual(pages, 5)
+
+    def test_filters_apply_to_every_page(self):
+        Transaction.objects.filter(
+            description__in=["Pagamento 0", "Pagamento 9"]
+        ).update(txn_type="IN")
+
+        first = self.client.get(self.url, {"limit": 1, "txn_type": "IN"}).json()
+        second = self.client.get(
+            self.url, {"limit": 1, "txn_type": "IN", "cursor": first["next"]}
+        ).json()
+
+        self.assertEqual(
+            [
+                row["description"]
+                for row in first["transactions"] + second["transactions"]
+            ],
+            ["Pagamento 0", "Pagamento 9"],
+        )
+        self.assertIsNone(second["next"])
+
+    def test_bad_cursor_is_rejected(self):
+        naive = encode_cursor(timezone.now().replace(tzinfo=None), 1)
+        for cursor in ("not-a-cursor", "bm90LWEtY3Vyc29y", naive):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {"cursor": cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.json()["errors"])
+
+    def test_other_users_accounts_are_not_found(self):
+        other = User.objects.create_user("luigi")
+        self.client.force_login(other)
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class RollupSignalTests(TestCase):
+    """
+    The monthly rollups kept up to date by the signals of single transactions
+    match the ones rebuilt from scratch.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "mario", first_name="Mario", last_name="Rossi"
+        )
+        self.main = BankAccount.objects.create(
+            user=self.user,
+            name="Main",
+            iban="IT00X0000000000000000000001",
+            bank_type="n26",
+        )
+        self.savings = BankAccount.objects.create(
+            user=self.user,
+            name="Savings",
+            iban="IT00X0000000000000000000002",
+            bank_type="n26",
+        )
+        self.food = Category.objects.create(
+            name="Spesa", txn_type="OUT", created_by=self.user
+        )
+        self.salary = Category.objects.create(
+            name="Stipendio", txn_type="IN", created_by=self.user
+        )
+        self.day = timezone.make_aware(datetime(2024, 3, 15, 12))
+
+    def add(self, account, amount, txn_type, category=None, days=0, **kwargs):
+        return Transaction.objects.create(
+            bank_account=account,
+            category=category,
+            date=self.day + timedelta(days=days),
+            amount=Decimal(amount),
+            txn_type=txn_type,
+            **kwargs,
+        )
+
+    def assertRollupsRebuilt(self):
+        def stored():
+            return sorted(
+                MonthlyRollup.objects.values_list(
+                    "bank_account_id",
+                    "category_id",
+                    "month",
+                    "income",
+                    "expense",
+                    "transfers_in",
+                    "transfers_out",
+                    "count",
+                ),
+                key=str,
+            )
+
+        maintained = stored()
+        rebuild_rollups(BankAccount.objects.filter(user=self.user))
+        self.assertEqual(maintained, stored())
+
+    def test_create(self):
+        self.add(self.main, "12.50", "OUT", self.food)
+        self.add(self.main, "7.50", "OUT", self.food, days=1)
+        self.add(self.main, "1500.00", "IN", self.salary, days=20)
+        self.add(self.main, "3.00", "OUT")
+
+        self.assertRollupsRebuilt()
+        self.assertEqual(MonthlyRollup.objects.count(), 3)
+
+    def test_update(self):
+        expense = self.add(self.main, "12.50", "OUT", self.food)
+        income = self.add(self.main, "1500.00", "IN", self.salary)
+
+        expense.amount = Decimal("20.00")
+        expense.date += timedelta(days=30)
+        expense.save()
+        income.category = None
+        income.bank_account = self.savings
+        income.save()
+
+        self.assertRollupsRebuilt()
+
+    def test_delete(self):
+        kept = self.add(self.main, "12.50", "OUT", self.food)
+        self.add(self.main, "7.50", "OUT", self.food).delete()
+        self.add(self.main, "1500.00", "IN", self.salary).delete()
+
+        self.assertRollupsRebuilt()
+        self.assertEqual(MonthlyRollup.objects.get().expense, kept.amount)
+
+    def test_delete_linked_transfer(self):
+        transfer = self.add(self.main, "100.00", "TRSF", transfer_account=self.savings)
+        self.add(self.savings, "100.00", "IN", linked_transfer=transfer)
+
+        transfer.delete()
+
+        self.assertRollupsRebuilt()
+        self.assertEqual(
+            MonthlyRollup.objects.get(bank_account=self.savings).income, 100
+        )
+
+    def test_delete_category_and_account(self):
+        transfer = self.add(self.main, "100.00", "TRSF", transfer_account=self.savings)
+        self.add(self.savings, "100.00", "IN", self.salary, linked_transfer=transfer)
+        self.add(self.main, "12.50", "OUT", self.food)
+
+        self.salary.delete()
+        self.assertRollupsRebuilt()
+
+        self.main.delete()
+        self.assertRollupsRebuilt()
+
+
+class ImportUploadTests(TestCase):
+    """
+    Uploads of several files that cannot be packed into one archive are
+    rejected on the form, without queuing a job.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "mario", first_name="Mario", last_name="Rossi"
+        )
+        self.account = BankAccount.objects.create(
+            user=self.user,
+            name="Main",
+            iban="IT00X0000000000000000000001",
+            bank_type="n26",
+        )
+        self.client.force_login(self.user)
+
+    def test_corrupted_archive_is_rejected(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("n26.csv", n26_file(purchases(0, 50)).read())
+        # Overwrite the compressed data of the member, keeping the archive directory
+        data = bytearray(buffer.getvalue())
+        data[40:80] = b"\xff" * 40
+        corrupted = ContentFile(bytes(data), name="n26.zip")
+
+        response = self.client.post(
+            reverse("import_csv"),
+            {
+                "file": [corrupted, n26_file(purchases(0, 2))],
+                "account": self.account.pk,
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("danneggiato", response.content.decode())
+        self.assertFalse(ImportJob.objects.exists())
@@ -7,7 +7,12 @@ from .views import (
     CompleteProfileView,
     CSVExportView,
     CSVImportView,
+    ImportJobConfirmView,
+    ImportJobProgressView,
+    MetricsView,
     SetMainAccountView,
+    TransactionListAPIView,
+    TransactionListView,
 )
 
 urlpatterns = [
@@ -23,6 +28,27 @@ urlpatterns = [
         "account/<int:pk>/main/", SetMainAccountView.as_view(), name="set_main_account"
     ),
     path("account/set-main/", SetMainAccountView.as_view(), name="set_main_account"),
+    path(
+        "account/<int:pk>/transactions/",
+        TransactionListView.as_view(),
+        name="transaction_list",
+    ),
+    path(
+        "api/accounts/<int:pk>/transactions/",
+        TransactionListAPIView.as_view(),
+        name="transaction_list_api",
+    ),
     path("import/", CSVImportView.as_view(), name="import_csv"),
+    path(
+        "import/jobs/<int:pk>/",
+        ImportJobProgressView.as_view(),
+        name="import_job_progress",
+    ),
+    path(
+        "import/jobs/<int:pk>/confirm/",
+        ImportJobConfirmView.as_view(),
+        name="import_job_confirm",
+    ),
     path("export/", CSVExportView.as_view(), name="export_csv"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
@@ -1,7 +1,10 @@
+from django.contrib import messages
 from django.shortcuts import redirect
 from django.urls import reverse
-from django.contrib import messages
-from ..models import BankAccount
+
+from ..services.account_summary import get_account_summary
+
+
 class EnsureBankAccountMixin:
     """
     Ensure that the user has at least one bank account before accessing certain views.
@@ -11,7 +14,9 @@ class EnsureBankAccountMixin:
 
     def dispatch(self, request, *args, **kwargs):
         if request.user.is_authenticated:
-            if not BankAccount.objects.filter(user=request.user).exists():
-                messages.warning(request, "Per favore aggiungi un conto bancario per continuare.")
+            if not get_account_summary(request).count:
+                messages.warning(
+                    request, "Per favore aggiungi un conto bancario per continuare."
+                )
                 return redirect(reverse(self.redirect_url), request=request)
         return super().dispatch(request, *args, **kwargs)
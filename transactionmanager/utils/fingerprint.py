@@ -0,0 +1,36 @@
+import hashlib
+from decimal import Decimal
+
+
+def transaction_fingerprint(date, amount, txn_type, description, partner_iban=""):
+    """
+    Return a normalized SHA-256 fingerprint identifying a bank transaction.
+    The date is reduced to the day, the amount to an absolute value with two
+    decimals, the description to upper case with collapsed whitespace and the
+    partner IBAN to upper case without spaces, so the same CSV row always maps
+    to the same value.
+    """
+    amount = abs(Decimal(str(amount))).quantize(Decimal("0.01"))
+    description = " ".join((description or "").split()).upper()
+    partner_iban = "".join((partner_iban or "").split()).upper()
+
+    payload = "|".join(
+        [date.strftime("%Y-%m-%d"), str(amount), txn_type, description, partner_iban]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RowsDigest:
+    """
+    Running SHA-256 of the rows of a CSV file, updated while the file is
+    streamed. hexdigest() returns the digest of the rows read so far.
+    """
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+
+    def update(self, row):
+        self.hash.update(("\x1f".join(row) + "\n").encode("utf-8"))
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
@@ -1,17 +1,65 @@
+import tempfile
+import zipfile
+import zlib
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse
-from django.shortcuts import redirect
+from django.core.cache import caches
+from django.core.files import File
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
-from django.utils.encoding import smart_str
-from django.views.generic import CreateView, DeleteView, FormView, ListView, UpdateView
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.generic import (
+    CreateView,
+    DeleteView,
+    FormView,
+    ListView,
+    TemplateView,
+    UpdateView,
+    View,
+)
+from django.views.generic.detail import BaseDetailView, SingleObjectMixin
 from django.views.generic.list import BaseListView
 
-from .forms import BankAccountForm, CSVImportForm, SetMainAccountForm, UserProfileForm
-from .models import BANK_CHOICES, BankAccount, Category, Transaction
-from .services.dispatcher import dispatch_import
-from .services.export import Exporter
+from .forms import (
+    BankAccountForm,
+    CSVImportForm,
+    SetMainAccountForm,
+    TransactionFilterForm,
+    UserProfileForm,
+)
+from .importers.reader import write_archive
+from .models import (
+    BANK_CHOICES,
+    BankAccount,
+    Category,
+    ExportCursor,
+    ImportJob,
+    Transaction,
+)
+from .services.account_summary import get_account_summary
+from .services.compression import (
+    CONTENT_TYPES,
+    EXTENSIONS,
+    accepts_gzip,
+    compress_lines,
+)
+from .services.data_version import get_data_version
+from .services.dispatcher import PARSERS
+from .services.export import (
+    Exporter,
+    advance_cursor_when_sent,
+    export_cache_key,
+    stream_and_cache,
+)
+from .services.jobs import confirm_job
+from .services.metrics import registry, scrape_allowed
+from .services.transactions import filter_transactions, transaction_page
 from .utils.complete_profile_required_mixin import CompleteProfileRequiredMixin
 from .utils.ensure_bank_account_mixin import EnsureBankAccountMixin
 
@@ -73,12 +121,13 @@ class BankAccountListCreateView(
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["accounts"] = self.get_queryset()
         context["BANK_CHOICES"] = BANK_CHOICES
 
-        if not self.get_queryset().filter(main_account=True).exists() and self.get_queryset().count() > 0:
+        summary = get_account_summary(self.request)
+        if summary.count and summary.main_account_id is None:
             messages.warning(
-                    self.request, "Per favore, seleziona un conto principale per continuare."
+                self.request,
+                "Per favore, seleziona un conto principale per continuare.",
             )
 
         return context
@@ -94,7 +143,9 @@ class BankAccountDeleteView(
         return BankAccount.objects.filter(user=self.request.user)
 
 
-class SetMainAccountView(LoginRequiredMixin, EnsureBankAccountMixin, CompleteProfileRequiredMixin, FormView):
+class SetMainAccountView(
+    LoginRequiredMixin, EnsureBankAccountMixin, CompleteProfileRequiredMixin, FormView
+):
     form_class = SetMainAccountForm
     template_name = "accounts/set_main_account.html"
     success_url = reverse_lazy("home_accounts")
@@ -110,7 +161,9 @@ class SetMainAccountView(LoginRequiredMixin, EnsureBankAccountMixin, CompletePro
         return super().form_valid(form)
 
 
-class CSVImportView(LoginRequiredMixin, EnsureBankAccountMixin, CompleteProfileRequiredMixin, FormView):
+class CSVImportView(
+    LoginRequiredMixin, EnsureBankAccountMixin, CompleteProfileRequiredMixin, FormView
+):
     form_class = CSVImportForm
     template_name = "transactionmanager/import_csv.html"
     success_url = reverse_lazy("import_csv")
@@ -118,62 +171,328 @@ class CSVImportView(LoginRequiredMixin, EnsureBankAccountMixin, CompleteProfileR
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs["user"] = self.request.user
+        kwargs["bank_types"] = get_account_summary(self.request).bank_types
         return kwargs
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["jobs"] = (
+            ImportJob.objects.filter(user=self.request.user)
+            .select_related("bank_account")
+            .order_by("-created_at")[:10]
+        )
+        return context
+
     def form_valid(self, form):
-        csv_file = form.cleaned_data["file"]
+        files = form.cleaned_data["file"]
         account = form.cleaned_data["account"]
+        mode = ImportJob.PREVIEW if form.cleaned_data["preview"] else ImportJob.IMPORT
 
-        try:
-            result = dispatch_import(
-                user=self.request.user,
-                file=csv_file,
-                bank_format=account.bank_type,
-                iban=account.iban,
-            )
-        except AttributeError:
+        if account.bank_type.lower() not in PARSERS:
             messages.error(
                 self.request,
                 f"Parser non esistente per: {account.bank_type}.",
             )
             return self.form_invalid(form)
 
-        except Exception as e:
-            messages.error(self.request, f"Errore durante l'importazione: {str(e)}")
-            return self.form_invalid(form)
+        if len(files) == 1:
+            job = ImportJob.objects.create(
+                user=self.request.user, bank_account=account, file=files[0], mode=mode
+            )
+        else:
+            # Several files are imported together as a single ZIP archive
+            with tempfile.TemporaryFile() as archive:
+                try:
+                    write_archive(
+                        archive,
+                        files,
+                        settings.IMPORT_ARCHIVE_MAX_FILES,
+                        settings.IMPORT_ARCHIVE_MAX_BYTES,
+                    )
+                except ValueError:
+                    messages.error(
+                        self.request,
+                        f"L'archivio supera i limiti consentiti: al massimo "
+                        f"{settings.IMPORT_ARCHIVE_MAX_FILES} file CSV e "
+                        f"{settings.IMPORT_ARCHIVE_MAX_BYTES // (1024 * 1024)} MB decompressi.",
+                    )
+                    return self.form_invalid(form)
+                except (zipfile.BadZipFile, zlib.error):
+                    messages.error(
+                        self.request,
+                        "Uno degli archivi caricati è danneggiato e non può essere letto.",
+                    )
+                    return self.form_invalid(form)
+                job = ImportJob.objects.create(
+                    user=self.request.user,
+                    bank_account=account,
+                    file=File(archive, name="import.zip"),
+                    mode=mode,
+                )
+
+        messages.success(
+            self.request,
+            f"Importazione #{job.pk} avviata: puoi seguirne l'avanzamento qui sotto.",
+        )
+        return super().form_valid(form)
 
-        if "categories" in result:
-            self.request.session["last_categories"] = result["categories"]
 
-        messages.success(self.request, "Evviva! Importazione completata!")
-        return super().form_valid(form)
+class ImportJobConfirmView(LoginRequiredMixin, SingleObjectMixin, View):
+    """
+    Confirm a previewed import, writing the rows parsed and classified by it.
+    """
+
+    model = ImportJob
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        job = self.get_object()
+        if confirm_job(job):
+            messages.success(request, f"Importazione #{job.pk} confermata.")
+        else:
+            messages.error(
+                request,
+                f"L'anteprima #{job.pk} non è più disponibile: carica di nuovo il file.",
+            )
+        return redirect("import_csv")
+
+
+class TransactionPageMixin:
+    """
+    Read the filters and the cursor of a page of the transactions of one of the
+    user's accounts from the query string, and load that page.
+    Must follow LoginRequiredMixin.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        self.account = get_object_or_404(
+            BankAccount, pk=kwargs["pk"], user=request.user
+        )
+        self.filters = TransactionFilterForm(request.GET, user=request.user)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_page(self):
+        """
+        Return the transactions of the page and the cursor of the next one.
+        """
+        data = self.filters.cleaned_data
+        queryset = filter_transactions(
+            Transaction.objects.filter(bank_account=self.account),
+            category=data["category"],
+            txn_type=data["txn_type"],
+            date_from=data["date_from"],
+            date_to=data["date_to"],
+        )
+        return transaction_page(
+            queryset,
+            cursor=data["cursor"],
+            limit=data["limit"] or settings.TRANSACTIONS_PAGE_SIZE,
+        )
 
 
-class CSVExportView(LoginRequiredMixin, EnsureBankAccountMixin, CompleteProfileRequiredMixin, BaseListView):
+class TransactionListView(
+    LoginRequiredMixin, CompleteProfileRequiredMixin, TransactionPageMixin, TemplateView
+):
+    template_name = "transactionmanager/transaction_list.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["account"] = self.account
+        context["filters"] = self.filters
+        if self.filters.is_valid():
+            context["transactions"], next_cursor = self.get_page()
+            if next_cursor:
+                query = self.request.GET.copy()
+                query["cursor"] = next_cursor
+                context["next_query"] = query.urlencode()
+            if self.filters.cleaned_data["cursor"]:
+                query = self.request.GET.copy()
+                query.pop("cursor")
+                context["first_query"] = query.urlencode()
+        return context
+
+
+class TransactionListAPIView(LoginRequiredMixin, TransactionPageMixin, View):
+    """
+    Page of the transactions of an account as JSON; `next` is the cursor to
+    pass back to get the following page, null on the last one.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not self.filters.is_valid():
+            return JsonResponse({"errors": self.filters.errors}, status=400)
+        transactions, next_cursor = self.get_page()
+        return JsonResponse(
+            {
+                "account": self.account.pk,
+                "transactions": [
+                    {
+                        "id": row["id"],
+                        "date": row["date"].isoformat(),
+                        "amount": str(row["amount"]),
+                        "txn_type": row["txn_type"],
+                        "description": row["description"],
+                        "category": row["category_id"],
+                        "category_name": row["category__name"],
+                        "transfer_account": row["transfer_account_id"],
+                        "linked_transfer": row["linked_transfer_id"],
+                    }
+                    for row in transactions
+                ],
+                "next": next_cursor,
+            }
+        )
+
+
+class ImportJobProgressView(LoginRequiredMixin, BaseDetailView):
+    model = ImportJob
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
+
+    def render_to_response(self, context, **response_kwargs):
+        return JsonResponse(self.object.progress())
+
+
+class MetricsView(View):
+    """
+    Metrics of this process in the Prometheus text format, served to clients
+    sending the METRICS_TOKEN bearer token.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not settings.METRICS_TOKEN:
+            raise Http404
+        if not scrape_allowed(
+            request.headers.get("Authorization"), settings.METRICS_TOKEN
+        ):
+            response = HttpResponse(
+                "Unauthorized", status=401, content_type="text/plain"
+            )
+            response["WWW-Authenticate"] = 'Bearer realm="metrics"'
+            return response
+        return HttpResponse(
+            registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+
+class CSVExportView(
+    LoginRequiredMixin,
+    EnsureBankAccountMixin,
+    CompleteProfileRequiredMixin,
+    BaseListView,
+):
     model = Transaction
 
     def get_queryset(self):
+        # The exporter only needs the related ids, so no join is required.
+        # Incoming legs of internal transfers are exported by their TRSF leg
         return Transaction.objects.filter(
-            bank_account__user=self.request.user
-        ).select_related("bank_account", "transfer_account")
+            bank_account__user=self.request.user, linked_transfer__isnull=True
+        ).only(
+            "id",
+            "date",
+            "amount",
+            "txn_type",
+            "description",
+            "category_id",
+            "bank_account_id",
+            "transfer_account_id",
+            "updated_at",
+        )
+
+    def get_since(self):
+        """
+        Return the moment of the previous export, unless a full export is requested
+        with `?mode=full` or the user never exported before.
+        """
+        if self.request.GET.get("mode") == "full":
+            return None
+        cursor = ExportCursor.objects.filter(user=self.request.user).first()
+        return cursor.exported_at if cursor else None
+
+    def get_compression(self):
+        """
+        Return how the export should be compressed and whether the compression is
+        transparent (Content-Encoding) or a compressed file download.
+        `?compress=gzip|zip` asks for a compressed file, otherwise gzip is used as
+        Content-Encoding when the client accepts it.
+        """
+        compress = self.request.GET.get("compress")
+        if compress in CONTENT_TYPES:
+            return compress, False
+        if accepts_gzip(self.request.headers.get("Accept-Encoding", "")):
+            return "gzip", True
+        return None, False
 
     def render_to_response(self, context, **response_kwargs):
-        transactions = context["object_list"]
-        categories = Category.objects.filter(
-            created_by=self.request.user
-        ).select_related("created_by")
+        since = self.get_since()
+        mode = "delta" if since else "full"
+        compression, content_encoding = self.get_compression()
+
+        # Nothing changed since the client's copy: answer 304 without touching the cursor
+        data_version = get_data_version(self.request.user)
+        representation = compression or "identity"
+        if content_encoding:
+            representation = f"{representation}-encoded"
+        etag = f'"{data_version.version}-{mode}-{representation}"'
+        last_modified = data_version.changed_at.timestamp()
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+            patch_vary_headers(response, ["Accept-Encoding"])
+            return response
+
+        # Taken before rendering, so rows changed during the export are sent again
+        exported_at = timezone.now()
+
+        cache_key = export_cache_key(self.request.user, data_version.version)
+        content = caches["exports"].get(cache_key) if mode == "full" else None
+        filename = "export-delta.csv" if since else "export.csv"
+
+        if content is not None:
+            lines = [content]
+        else:
+            lines = self.get_exporter(context["object_list"], since).iter_csv()
+            if mode == "full":
+                lines = stream_and_cache(lines, cache_key)
+
+        content_type = "text/csv"
+        chunks = lines
+        if compression:
+            chunks = compress_lines(lines, compression, filename=filename)
+            if not content_encoding:
+                content_type = CONTENT_TYPES[compression]
+                filename = f"{filename.rsplit('.', 1)[0]}.{EXTENSIONS[compression]}"
+
+        # The cursor only moves once the whole export has been sent
+        response = StreamingHttpResponse(
+            advance_cursor_when_sent(chunks, self.request.user, exported_at),
+            content_type=content_type,
+        )
+        if content_encoding:
+            response["Content-Encoding"] = compression
 
-        csv_string = Exporter(
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+    def get_exporter(self, transactions, since):
+        return Exporter(
             transactions,
             self.request.user,
-            categories=categories,
-            in_categories=Category.input_categories(),
-        ).render_transactions_to_csv()
-
-        return HttpResponse(
-            smart_str(csv_string),
-            content_type="text/csv",
-            headers={
-                "Content-Disposition": 'attachment; filename="export.csv"',
-            },
+            categories=Category.objects.filter(created_by=self.request.user).order_by(
+                "id"
+            ),
+            in_categories=Category.input_categories(self.request.user).values_list(
+                "name", flat=True
+            ),
+            since=since,
         )